@@ -11,16 +11,26 @@ import matplotlib.pyplot as plt
 from .. import lanmpproject as lp
 import pandas as pd
 import os
+import json
+import tempfile
 from .spereader import SpeFile
-from .loadfile import FileSet
+from .spe_archive import SpeArchive, ARCHIVE_TYPES
+from .loadfile import FileSet, _map
+from . import peakfit
+from .despike import despike_neighbors
+from .background import BackgroundLibrary, file_key
 
 
 TAG = False
 from scipy.signal import savgol_filter
 from scipy.signal import find_peaks
+from scipy.signal import peak_prominences
+from functools import partial
 
 
 def _my_spe_loader(filepath):
+    if os.path.splitext(filepath)[1].lower() in ARCHIVE_TYPES:
+        return SpeArchive(filepath)
     return SpeFile(filepath)
 
 
@@ -148,9 +158,70 @@ def get_color(value, cmap, val_list ,start=0, N=1000):
         return None
     
     
+def _get_spectrum(file):
+    return file.get_spectrum()
+
+
+def _block_peaks(block, filter_args, find_peak_args):
+    '''
+    Normalizes every row of block to [0, 1], smooths it with savgol_filter and runs find_peaks on it.
+    Returns (row in block, pixel, height in the smoothed normalized row, prominence) arrays of all peaks.
+    '''
+    Y = np.array(block, dtype=float)
+    Y -= np.nanmin(Y, axis=1, keepdims=True)
+    Y /= np.nanmax(Y, axis=1, keepdims=True)
+    Y = savgol_filter(np.nan_to_num(Y, nan=0.0), axis=1, **filter_args)
+    rows, pixels, prominences = [], [], []
+    for r, y in enumerate(Y):
+        peaks = find_peaks(y, **find_peak_args)[0]
+        rows.append(np.full(len(peaks), r)); pixels.append(peaks)
+        prominences.append(peak_prominences(y, peaks)[0])
+    rows, pixels = np.concatenate(rows).astype(int), np.concatenate(pixels).astype(int)
+    return rows, pixels, Y[rows, pixels], np.concatenate(prominences)
+
+
+def _take_rows(matrix, rows):
+    '''
+    Returns matrix[rows], as a view if rows is a contiguous ascending run of rows
+    '''
+    if len(rows) and rows[-1] - rows[0] == len(rows) - 1 and np.all(np.diff(rows) == 1):
+        return matrix[rows[0]:rows[-1] + 1]
+    return matrix[rows]
+
+
 class SpeFileSet(FileSet):
-    def __init__(self, files, pattern = None, find_text = '', filename = None):
-        super().__init__(files, pattern, find_text, filename, file_type = '.spe', loader= _my_spe_loader)
+    '''
+    Spectra are stored as one contiguous (n_files, n_pixels) matrix per column, self.matrix['y'] (and self.matrix['y_bg']),
+    NaN padded when spectra have different lengths. The DataFrame columns 'y'/'y_bg' hold views of the matrix rows,
+    'x'/'x_bg' the x axis of each file (the same array object for files sharing a calibration) and 'row' the matrix row of each file.
+    save(path) and SpeFileSet.open(path) store and reopen a processed set, see FileSet.save.
+    With store, the matrices live in memory mapped files and are processed chunksize spectra at a time (out-of-core).
+    Subsets made by select or nearest share the matrices: flat_field, normalize and despike on a subset change its
+    spectra in the set it was taken from as well (and update min/max there), the other spectra are left untouched.
+    '''
+    def __init__(self, files, pattern = None, find_text = '', filename = None, file_type = '.spe', workers = None, processes = False,
+                 lazy = False, max_resident = 32, dtype = np.float32, manifest = False, max_age = 0, store = None, chunksize = None):
+        '''
+        file_type: '.spe', or '.h5'/'.zarr' for archives written by spe_archive.convert
+        workers, processes: parallel loading and spectrum extraction, see FileSet
+        lazy, max_resident: keep at most max_resident decoded files in memory, see FileSet
+        manifest, max_age: list folders and decode the pattern through the persistent folder manifest, see FileSet
+        dtype: dtype of the spectra matrix
+        store: folder for out-of-core sets. The spectra matrices are then memory mapped .npy files in a sub folder
+            of their own in this folder (so several sets can share one store), the files are loaded lazily and loading, flat_field, normalize, min/max and reductions run chunksize
+            spectra at a time, so memory use does not grow with the number of files.
+        chunksize: number of spectra per chunk. The default is None, i.e. 1024 with a store and everything at once without.
+        '''
+        self.dtype = dtype
+        self.store = store
+        self.chunksize = chunksize if chunksize is not None or store is None else 1024
+        self.matrix = {}
+        self.axes = []
+        self._buffers = {}; self._x_rows = {}; self._lengths = {}; self._generation = 0
+        self._resampled = {}; self._store_dir = None
+        super().__init__(files, pattern, find_text, filename, file_type = file_type, loader= _my_spe_loader,
+                         workers = workers, processes = processes, lazy = lazy or store is not None,
+                         max_resident = max_resident, manifest = manifest, max_age = max_age)
         self._load_data()
         self._load_data(col=1, keys = ['x_bg', 'y_bg'])
         self._get_tag()
@@ -166,11 +237,287 @@ class SpeFileSet(FileSet):
     def _load_data(self, col=0, keys = ['x','y']):
         
         if col in self.df.columns:
-            xlist = []; ylist = []
-            for file in self.df.iloc[:,col]:
-                (x,y) = file.get_spectrum()
-                xlist.append(np.array(x)); ylist.append(np.array(y))
-            self.df[keys[0]] = xlist; self.df[keys[1]] = ylist 
+            files = self.df.iloc[:,col]
+            step = self.chunksize or len(files)
+            for start in range(0, len(files), step):
+                spectra = _map(_get_spectrum, files.iloc[start:start + step], self.workers)
+                self._store_spectra(keys, spectra, rows=range(start, start + len(spectra)) if start else None,
+                                    nrows=len(files))
+            self._set_columns(keys)
+    
+    def _store_spectra(self, keys, spectra, rows=None, nrows=None):
+        '''
+        Writes a list of (x, y) spectra into the matrix self.matrix[keys[1]], at the given matrix rows or, if rows is None,
+        into a new matrix of nrows rows (default len(spectra)). The DataFrame columns keys are updated by _set_columns.
+        '''
+        key = keys[1]
+        lengths = [len(y) for _, y in spectra]
+        if rows is None:
+            rows = range(len(spectra))
+            nrows = nrows or len(spectra)
+            previous = self._buffers.get(key)
+            self._buffers[key] = self._new_buffer(key, (nrows, max(lengths)))
+            self._x_rows[key] = []; self._lengths[key] = []
+            self.matrix[key] = self._buffers[key]
+            if previous is not None:
+                self._release(previous)
+            if key == 'y':
+                self.df['row'] = np.arange(nrows)
+        self._reserve(key, max(rows) + 1, max(lengths))
+        
+        matrix = self.matrix[key]
+        for r, (x, y), n in zip(rows, spectra, lengths):
+            matrix[r, :n] = y
+            matrix[r, n:] = np.nan
+            self._x_rows[key][r] = self._axis(x)
+            self._lengths[key][r] = n
+    
+    def _set_columns(self, keys):
+        '''
+        Points the DataFrame columns keys (x, y) at the stored axes and at views of the matrix rows
+        '''
+        key = keys[1]
+        matrix = self.matrix[key]
+        rows = self.df['row'].to_numpy()
+        self.df[keys[0]] = [self._x_rows[key][r] for r in rows]
+        self.df[keys[1]] = [matrix[r, :self._lengths[key][r]] for r in rows]
+    
+    def _new_buffer(self, key, shape):
+        '''
+        Returns a NaN filled matrix, in memory or, with a store, as a new memory mapped .npy file in the sub folder
+        of the store that belongs to this set
+        '''
+        if self.store is None:
+            return np.full(shape, np.nan, dtype=self.dtype)
+        if self._store_dir is None:
+            os.makedirs(self.store, exist_ok=True)
+            self._store_dir = tempfile.mkdtemp(prefix='spefileset_', dir=self.store)
+        self._generation += 1
+        path = os.path.join(self._store_dir, '%s_%d.npy' % (key, self._generation))
+        buffer = np.lib.format.open_memmap(path, mode='w+', dtype=self.dtype, shape=shape)
+        for rows in self._chunks(shape[0]):
+            buffer[rows] = np.nan
+        return buffer
+    
+    def _release(self, buffer):
+        # Removes the file of a memory mapped buffer that was replaced by a larger or a reloaded one
+        if isinstance(buffer, np.memmap) and buffer.filename is not None and self.store is not None:
+            filename = buffer.filename
+            del buffer
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+    
+    def _chunks(self, n):
+        '''
+        Yields slices of at most self.chunksize rows covering range(n)
+        '''
+        step = self.chunksize or n or 1
+        for start in range(0, n, step):
+            yield slice(start, min(start + step, n))
+
+    def _row_blocks(self, rows = None):
+        '''
+        Yields the matrix rows (default: the rows of self.df) in ascending blocks of at most self.chunksize rows,
+        each one as a slice if the rows are contiguous. Subsets made by select or nearest share the matrix,
+        so in place processing must only touch their own rows.
+        '''
+        rows = np.unique(self.df['row'].to_numpy() if rows is None else rows)
+        for chunk in self._chunks(len(rows)):
+            block = rows[chunk]
+            yield slice(block[0], block[-1] + 1) if block[-1] - block[0] == len(block) - 1 else block
+    
+    def _reserve(self, key, nrows, width):
+        '''
+        Makes self.matrix[key] at least nrows x width. The underlying buffer grows geometrically so that appending
+        files one refresh at a time does not copy the matrix every time.
+        '''
+        buffer = self._buffers[key]
+        n, w = self.matrix[key].shape
+        if nrows > buffer.shape[0] or width > buffer.shape[1]:
+            grown = self._new_buffer(key, (max(nrows, 2 * buffer.shape[0]), max(width, buffer.shape[1])))
+            for rows in self._chunks(n):
+                grown[rows, :w] = self.matrix[key][rows]
+            self.matrix[key] = None
+            self._buffers[key] = grown
+            self._release(buffer)
+            buffer = grown
+        nrows = max(nrows, n)
+        self.matrix[key] = buffer[:nrows, :max(width, w)]
+        self._x_rows[key].extend([None] * (nrows - len(self._x_rows[key])))
+        self._lengths[key].extend([0] * (nrows - len(self._lengths[key])))
+    
+    def _axis(self, x):
+        '''
+        Returns the stored x axis equal to x, so that files with the same calibration share one array
+        '''
+        x = np.asarray(x)
+        for axis in self.axes:
+            if axis.shape == x.shape and np.array_equal(axis, x):
+                return axis
+        self.axes.append(x)
+        return x
+    
+    def refresh(self):
+        '''
+        Loads only new and changed files (see FileSet.refresh) and writes their spectra into the matrix:
+        changed files overwrite their row and new files are appended.
+        Processing such as flat_field or normalize is not applied to these rows.
+        '''
+        added, changed = self._refresh_files()
+        if added:
+            n = len(self.matrix['y'])
+            self.df.loc[added, 'row'] = np.arange(n, n + len(added))
+            self.df['row'] = self.df['row'].astype(int)
+        
+        labels = changed + added
+        if labels:
+            for col, keys in ((0, ['x','y']), (1, ['x_bg','y_bg'])):
+                if col in self.df.columns and keys[1] in self.matrix:
+                    spectra = _map(_get_spectrum, self.df.loc[labels, col], self.workers)
+                    self._store_spectra(keys, spectra, rows=self.df.loc[labels, 'row'].tolist())
+                    self._set_columns(keys)
+            self._get_tag()
+            self._update_min_max()
+        print('Refreshed: %i new and %i changed file(s)' % (len(added), len(changed)))
+        return self
+    
+    @classmethod
+    def open(cls, path, mmap = True, max_resident = 32):
+        '''
+        Reopens a SpeFileSet written by save, with the spectra matrices memory mapped. See FileSet.open.
+        '''
+        return super().open(path, mmap = mmap, loader = _my_spe_loader, max_resident = max_resident)
+    
+    def _arrays(self):
+        '''
+        Saves the spectra matrices, the distinct x axes and, per matrix row, the index of its axis and its length
+        '''
+        arrays = {}
+        state = {'dtype': np.dtype(self.dtype).str, 'keys': list(self.matrix), 'naxes': len(self.axes), 'tag': self.tag}
+        for i, axis in enumerate(self.axes):
+            arrays['axis%d' % i] = axis
+        for key, matrix in self.matrix.items():
+            arrays[key] = matrix
+            arrays[key + '_axis'] = np.array([next(i for i, axis in enumerate(self.axes) if axis is x)
+                                              for x in self._x_rows[key]], dtype=int)
+            arrays[key + '_length'] = np.array(self._lengths[key], dtype=int)
+        columns = [column for column in ('x', 'y', 'x_bg', 'y_bg') if column in self.df.columns]
+        return arrays, columns, state
+    
+    def _restore(self, arrays, state):
+        '''
+        Rebuilds matrix, axes and the DataFrame columns x, y (x_bg, y_bg) as views of the saved arrays
+        '''
+        self.dtype = np.dtype(state['dtype']).type
+        self.tag = state['tag']
+        self.axes = [arrays['axis%d' % i] for i in range(state['naxes'])]
+        self.matrix = {}; self._buffers = {}; self._x_rows = {}; self._lengths = {}; self._generation = 0
+        self.store = None; self.chunksize = None; self._resampled = {}; self._store_dir = None
+        rows = self.df['row'].to_numpy()
+        for key in state['keys']:
+            self.matrix[key] = self._buffers[key] = arrays[key]
+            self._x_rows[key] = [self.axes[i] for i in arrays[key + '_axis']]
+            self._lengths[key] = arrays[key + '_length'].tolist()
+            x_key = 'x' + key[1:]
+            self.df[x_key] = [self._x_rows[key][r] for r in rows]
+            self.df[key] = [arrays[key][r, :self._lengths[key][r]] for r in rows]
+    
+    def _rows(self, key = 'y'):
+        '''
+        Returns the spectra matrix of column key in DataFrame order. This is the stored matrix itself (no copy)
+        unless rows of the DataFrame were reordered or dropped, and a view of it if they are a contiguous run of rows
+        (e.g. a subset from select).
+        '''
+        return _take_rows(self.matrix[key], self.df['row'].to_numpy())
+    
+    @property
+    def Y(self):
+        '''
+        (n_files, n_pixels) spectra matrix in DataFrame order
+        '''
+        return self._rows('y')
+    
+    @property
+    def x(self):
+        '''
+        x axis (wavelength) of the first file, shared by the files recorded with the same calibration
+        '''
+        return self.df['x'].iloc[0]
+    
+    def resample(self, policy = 'union', npoints = None):
+        '''
+        Interpolates all spectra onto a common wavelength grid, for sets whose files have different calibrations
+        (e.g. another grating centre wavelength or step-and-glue files).
+
+        Parameters
+        ----------
+        policy : TYPE = 'union' or 'overlap', optional
+            DESCRIPTION. The default is 'union'. The grid spans all calibrations ('union', NaN where a spectrum has
+            no data) or only the range covered by every calibration ('overlap').
+        npoints : TYPE = Integer, optional
+            DESCRIPTION. The default is None, i.e. a step equal to the finest pixel step of the set.
+
+        Returns
+        -------
+        (grid, Y) with Y the (n_files, len(grid)) resampled spectra in DataFrame order.
+        The result is cached until the spectra change (flat_field, normalize, refresh...).
+
+        '''
+        grid, matrix = self._resample(policy, npoints)
+        return grid, _take_rows(matrix, self.df['row'].to_numpy())
+    
+    def _resample(self, policy, npoints):
+        '''
+        Returns (grid, resampled matrix) in storage row order, cached in self._resampled.
+        Spectra sharing a calibration are interpolated together, with one set of weights.
+        '''
+        key = (policy, npoints, len(self.matrix['y']))
+        if key in self._resampled:
+            return self._resampled[key]
+        x_rows = self._x_rows['y']
+        groups = [(axis, np.array([r for r, x in enumerate(x_rows) if x is axis])) for axis in self.axes]
+        groups = [(axis, rows) for axis, rows in groups if len(rows)]
+        lows = [np.nanmin(axis) for axis, _ in groups]
+        highs = [np.nanmax(axis) for axis, _ in groups]
+        if policy == 'union':
+            low, high = min(lows), max(highs)
+        elif policy == 'overlap':
+            low, high = max(lows), min(highs)
+        else:
+            raise ValueError("policy should be 'union' or 'overlap', got %r" % policy)
+        if low >= high:
+            raise ValueError('The calibrations of the spectra do not overlap (%g to %g)' % (low, high))
+        if npoints is None:
+            step = min(np.median(np.abs(np.diff(axis))) for axis, _ in groups)
+            npoints = int(round((high - low) / step)) + 1
+        grid = np.linspace(low, high, npoints)
+        
+        resampled = self._new_buffer('resampled', (len(self.matrix['y']), npoints))
+        for axis, rows in groups:
+            order = np.argsort(axis)
+            xs = axis[order]
+            right = np.clip(np.searchsorted(xs, grid), 1, len(xs) - 1)
+            weight = (grid - xs[right - 1]) / (xs[right] - xs[right - 1])
+            outside = (grid < xs[0]) | (grid > xs[-1])
+            for chunk in self._chunks(len(rows)):
+                Y = self.matrix['y'][rows[chunk]][:, order]
+                block = Y[:, right - 1] * (1 - weight) + Y[:, right] * weight
+                block[:, outside] = np.nan
+                resampled[rows[chunk]] = block
+        self._resampled[key] = (grid, resampled)
+        return grid, resampled
+    
+    def _common(self):
+        '''
+        Returns (x, matrix in storage row order) for plots and tables: the matrix itself if all files of the
+        DataFrame share one calibration, and the spectra resampled onto the union grid otherwise
+        '''
+        x = self.x
+        if all(axis is x for axis in self.df['x']):
+            return x, self.matrix['y'][:, :len(x)]
+        return self._resample('union', None)
          
         
     def _get_tag(self):
@@ -182,39 +529,315 @@ class SpeFileSet(FileSet):
         if fnos is None: fnos = range(len(self.df[0]))
         self.df['no'] = fnos
         
-    def flat_field(self):
-        fy_list = []
-        if 'y_bg' in self.df.columns:
-            self.df['y']= self.df['y']-self.df['y_bg']
-        else:
-            self.df['y']= self.df['y'].apply(lambda x: x-min(x))
+    def flat_field(self, background = None):
+        '''
+        Subtracts the background from the spectra: the background column of each file (y_bg) if there is one,
+        otherwise the minimum of each spectrum.
+        background: a BackgroundLibrary, or a folder (or list) of dark .spe files added to the default library.
+            The dark spectrum matching the exposure time and regions of interest of each file is then subtracted,
+            with one broadcast subtraction per group of files sharing these settings.
+        '''
+        if background is not None:
+            return self._subtract_background(background)
+        Y = self.matrix['y']
+        for rows in self._row_blocks():
+            if 'y_bg' in self.matrix:
+                Y[rows] -= self.matrix['y_bg'][rows]
+            else:
+                Y[rows] -= np.nanmin(Y[rows], axis=1, keepdims=True)
          
         self._update_min_max()
         return self
         
+    def _subtract_background(self, background):
+        if not isinstance(background, BackgroundLibrary):
+            darks = background
+            background = BackgroundLibrary()
+            background.add(darks)
+        keys = {}
+        for file, row in zip(self.df.iloc[:,0], self.df['row']):
+            keys.setdefault(json.dumps(file_key(file.filepath)), []).append(row)
+        
+        Y = self.matrix['y']
+        missing = 0
+        for key, rows in keys.items():
+            y_bg = background.get(json.loads(key))
+            if y_bg is None:
+                missing += len(rows)
+                continue
+            for block in self._row_blocks(rows):
+                Y[block, :len(y_bg)] -= y_bg
+        if missing:
+            print('PCA WARNING: no background with the exposure time and regions of interest of %i file(s)' % missing)
+        self._update_min_max()
+        return self
+        
     def normalize(self):
-        self.df['y'] = self.df['y'].apply(get_norm)
+        Y = self.matrix['y']
+        for rows in self._row_blocks():
+            Y[rows] -= np.nanmin(Y[rows], axis=1, keepdims=True)
+            Y[rows] /= np.nanmax(Y[rows], axis=1, keepdims=True)
+        self._update_min_max()
+        return self
+    
+    def despike(self, threshold = 6, width = 2):
+        '''
+        Removes cosmic-ray spikes from the spectra of self.df with despike.despike_neighbors, chunksize spectra at a time.
+        The replaced pixels are marked in self.spike_mask, a boolean matrix with the rows of self.matrix['y'].
+        '''
+        Y = self.matrix['y']
+        self.spike_mask = np.zeros(Y.shape, dtype=bool)
+        for rows in self._row_blocks():
+            block = np.array(Y[rows])
+            Y[rows], self.spike_mask[rows] = despike_neighbors(block, threshold, width, out = block)
         self._update_min_max()
         return self
+    
+    def reduce(self, function, key = 'y'):
+        '''
+        Returns function(block, axis=1) of every spectrum, in DataFrame order, computed chunksize spectra at a time,
+        e.g. reduce(np.nanmax) or reduce(np.nanargmax)
+        '''
+        matrix = self.matrix[key]
+        result = np.concatenate([function(matrix[rows], axis=1) for rows in self._chunks(len(matrix))])
+        return result[self.df['row'].to_numpy()]
+    
+    def max(self):
+        return self.reduce(np.nanmax)
+    
+    def argmax(self):
+        '''
+        Returns the x value (wavelength) of the maximum of every spectrum, in DataFrame order
+        '''
+        pixels = self.reduce(np.nanargmax)
+        return np.array([x[p] for x, p in zip(self.df['x'], pixels)])
         
     def _update_min_max(self):
-        self.df['min'] = self.df['y'].apply(lambda x: x.min())
-        self.df['max'] = self.df['y'].apply(lambda x: x.max())
+        # Called whenever the spectra change, so the cached resampled spectra are dropped here
+        for _, resampled in self._resampled.values():
+            self._release(resampled)
+        self._resampled.clear()
+        self.df['min'] = self.reduce(np.nanmin)
+        self.df['max'] = self.reduce(np.nanmax)
+        # A subset (select, nearest) shares the matrix with the set it was taken from, so the rows it changed
+        # are updated in that set (and in its own parent) too
+        changed = self.df.drop_duplicates('row').set_index('row')[['min', 'max']]
+        parent = self._parent
+        while parent is not None:
+            rows = parent.df['row']
+            at = rows.isin(changed.index).to_numpy()
+            if at.any():
+                parent.df.loc[at, ['min', 'max']] = changed.loc[rows[at]].to_numpy()
+            parent = parent._parent
         
-    def data(self, variable = None, transposed = False, round_lambda = 2):
+    def data(self, variable = None, transposed = False, round_lambda = 2, chunksize = None):
+        '''
+        Returns the spectra as a DataFrame indexed by variable with the wavelengths as columns (or the transpose).
+        With chunksize, returns a generator of such DataFrames of at most chunksize spectra instead,
+        reading only those rows of the matrix at a time.
+        '''
         if variable is None: variable = self.variable
-        l = self.df['x'][0]
+        l, matrix = self._common()
         if round_lambda is not None: l = l.round(round_lambda)
+        if chunksize is not None:
+            return self._data_chunks(variable, transposed, l, matrix, chunksize)
+        Y = _take_rows(matrix, self.df['row'].to_numpy())
             
         if transposed:
-            dt = pd.DataFrame(np.stack(self.df['y']).transpose(), columns=self.df[variable], index = l)
+            dt = pd.DataFrame(Y.transpose(), columns=self.df[variable], index = l)
         else: 
-            dt = pd.DataFrame(np.stack(self.df['y']), index=self.df[variable], columns = l)
+            dt = pd.DataFrame(Y, index=self.df[variable], columns = l)
         return dt
+    
+    def find_peaks_all(self, variable = None, filter_args = {'window_length':9, 'polyorder':2},
+                       find_peak_args = {'prominence':0.005, 'height':0.01}, workers = None, plot = False, cmap = plt.cm.rainbow):
+        '''
+        Finds the peaks of all spectra at once, like my_find_peaks does for one spectrum: every spectrum is
+        normalized to [0, 1] and smoothed with one savgol_filter call along the pixel axis, then find_peaks runs.
+        This is done on blocks of spectra in a worker pool, at most workers blocks of chunksize spectra in memory
+        at a time.
+
+        Parameters
+        ----------
+        workers : TYPE = Integer, optional
+            DESCRIPTION. The default is None, i.e. self.workers. Number of parallel workers (see loadfile._map).
+        plot : TYPE = Boolean, optional
+            DESCRIPTION. The default is False. Plots the peak positions against variable, coloured by height.
+
+        Returns
+        -------
+        DataFrame with one row per peak and the columns file (index label in self.df), variable, pixel, position,
+        height (of the smoothed normalized spectrum), prominence and intensity (of the spectrum itself)
+
+        '''
+        if variable is None: variable = self.variable
+        if workers is None: workers = self.workers
+        x, matrix = self._common()
+        rows = self.df['row'].to_numpy()
+        
+        step = self.chunksize or max(1, -(-len(rows) // (workers or 1)))
+        starts = range(0, len(rows), step)
+        found = []
+        for first in range(0, len(starts), workers or 1):
+            blocks = [_take_rows(matrix, rows[start:start + step]) for start in starts[first:first + (workers or 1)]]
+            found += _map(partial(_block_peaks, filter_args=filter_args, find_peak_args=find_peak_args),
+                          blocks, workers, self.processes)
+        index = np.concatenate([r + i * step for i, (r, _, _, _) in enumerate(found)]).astype(int)
+        pixels = np.concatenate([p for _, p, _, _ in found]).astype(int)
+        heights = np.concatenate([h for _, _, h, _ in found])
+        prominences = np.concatenate([q for _, _, _, q in found])
+        
+        table = pd.DataFrame({'file': self.df.index.to_numpy()[index],
+                              variable: self.df[variable].to_numpy()[index],
+                              'pixel': pixels,
+                              'position': x[pixels],
+                              'height': heights,
+                              'prominence': prominences,
+                              'intensity': matrix[rows[index], pixels]})
+        if plot:
+            plt.figure()
+            plt.scatter(table['position'], table[variable], c = table['height'], cmap = cmap, s = 4)
+            cbar = plt.colorbar()
+            cbar.set_label('Normalized height')
+            plt.xlabel(r'$\lambda$ (nm)')
+            plt.ylabel(variable)
+            put_tag(self.tag)
+        return table
+    
+    def linewidths(self, peaks = None, rel_height = 0.5, **kwargs):
+        '''
+        Full width at half maximum of every detected peak of every spectrum, like find_fwhm but with the
+        half-maximum crossings linearly interpolated between pixels and one width per peak.
+        All peaks are processed together with numpy (chunksize peaks at a time).
+
+        Parameters
+        ----------
+        peaks : TYPE = DataFrame, optional
+            DESCRIPTION. The default is None, i.e. find_peaks_all(**kwargs). A peak table from find_peaks_all.
+        rel_height : TYPE = Float, optional
+            DESCRIPTION. The default is 0.5. The width is measured at rel_height of the peak above its base,
+            like scipy.signal.peak_widths: the base is the peak height minus its prominence (columns height and
+            prominence of the peak table), taken from the normalized spectrum back to the intensity of the spectrum.
+
+        Returns
+        -------
+        The peak table with the columns left and right (positions of the crossings) and fwhm.
+        The width is NaN if the spectrum does not fall below that level on both sides of the peak.
+
+        '''
+        if peaks is None: peaks = self.find_peaks_all(**kwargs)
+        x, matrix = self._common()
+        rows = self.df['row'].to_numpy()[self.df.index.get_indexer(peaks['file'])]
+        pixels = peaks['pixel'].to_numpy()
+        bases = (peaks['height'] - peaks['prominence']).to_numpy()
+        columns = np.arange(matrix.shape[1])
+        left = np.full(len(peaks), np.nan); right = np.full(len(peaks), np.nan)
+        
+        for chunk in self._chunks(len(peaks)):
+            Y = np.asarray(matrix[rows[chunk]], dtype=float)
+            p = pixels[chunk]
+            n = np.arange(len(p))
+            low = np.nanmin(Y, axis=1)
+            base = low + bases[chunk] * (np.nanmax(Y, axis=1) - low)
+            level = base + rel_height * (Y[n, p] - base)
+            below = Y < level[:, None]
+            # last pixel below the level left of the peak and first one right of it
+            before = below & (columns < p[:, None])
+            after = below & (columns > p[:, None])
+            j = len(columns) - 1 - np.argmax(before[:, ::-1], axis=1)
+            k = np.argmax(after, axis=1)
+            has_left = before.any(axis=1); has_right = after.any(axis=1)
+            j1 = np.minimum(j + 1, len(columns) - 1); k0 = np.maximum(k - 1, 0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                left_pixel = j + (level - Y[n, j]) / (Y[n, j1] - Y[n, j])
+                right_pixel = k0 + (level - Y[n, k0]) / (Y[n, k] - Y[n, k0])
+            left[chunk] = np.where(has_left, left_pixel, np.nan)
+            right[chunk] = np.where(has_right, right_pixel, np.nan)
+        
+        pixel_axis = np.arange(len(x))
+        table = peaks.copy()
+        table['left'] = np.interp(left, pixel_axis, x)
+        table['right'] = np.interp(right, pixel_axis, x)
+        table['fwhm'] = np.abs(table['right'] - table['left'])
+        return table
+    
+    def fit_peaks(self, model = 'lorentzian', window = None, variable = None, workers = None, chunksize = None):
+        '''
+        Fits one peak per spectrum, warm-started along variable, in a process pool. See peakfit.fit_peaks.
+        Returns a parameter table with the index of self.df.
+        '''
+        return peakfit.fit_peaks(self, model, window, variable, workers, chunksize)
+    
+    def to_cube(self, variables = None, store = None, masked = False):
+        '''
+        Pivots the spectra into an N-d array indexed by each variable and then by wavelength.
+
+        Parameters
+        ----------
+        variables : TYPE = List of strings, optional
+            DESCRIPTION. The default is None, i.e. all the variables of the pattern.
+        store : TYPE = String, optional
+            DESCRIPTION. The default is None. Path of a .npy file to hold the cube as a memory map, for large maps.
+        masked : TYPE = Boolean, optional
+            DESCRIPTION. The default is False. Missing points (combinations of variables without a file) are NaN,
+            and with masked = True the cube is a numpy masked array with these points masked.
+
+        Returns
+        -------
+        (cube, coords) where coords is a dictionary {variable: sorted values along its axis, 'x': wavelength}
+
+        '''
+        if variables is None:
+            variables = list(self.pattern) if self.pattern is not None else [self.variable]
+        l, matrix = self._common()
+        values = self.df[variables].to_numpy(dtype=float)
+        valid = ~np.isnan(values).any(axis=1)
+        if not valid.all():
+            print('PCA WARNING: %i file(s) without a value for %s are left out of the cube' % ((~valid).sum(), variables))
+        coords = {}; codes = []
+        for variable, column in zip(variables, values[valid].T):
+            coords[variable], code = np.unique(column, return_inverse=True)
+            codes.append(code)
+        coords['x'] = l
+        shape = tuple(len(coords[variable]) for variable in variables)
+        points = np.ravel_multi_index(codes, shape)
+        if len(np.unique(points)) < len(points):
+            print('PCA WARNING: %i file(s) share the same %s, the cube keeps the last one' % (len(points) - len(np.unique(points)), variables))
+        
+        if store is None:
+            cube = np.full(shape + (len(l),), np.nan, dtype=self.dtype)
+            flat = cube.reshape(-1, len(l))
+        else:
+            cube = np.lib.format.open_memmap(store, mode='w+', dtype=self.dtype, shape=shape + (len(l),))
+            flat = cube.reshape(-1, len(l))
+            for chunk in self._chunks(len(flat)):
+                flat[chunk] = np.nan
+        rows = self.df['row'].to_numpy()[valid]
+        for chunk in self._chunks(len(rows)):
+            flat[points[chunk]] = matrix[rows[chunk]]
+        
+        if masked:
+            missing = np.ones(np.prod(shape), dtype=bool)
+            missing[points] = False
+            mask = np.broadcast_to(missing.reshape(shape + (1,)), cube.shape)
+            cube = np.ma.MaskedArray(cube, mask=mask)
+        return cube, coords
+    
+    def _data_chunks(self, variable, transposed, l, matrix, chunksize):
+        rows = self.df['row'].to_numpy()
+        values = self.df[variable]
+        for start in range(0, len(rows), chunksize):
+            Y = matrix[rows[start:start + chunksize]]
+            index = values.iloc[start:start + chunksize]
+            if transposed:
+                yield pd.DataFrame(Y.transpose(), columns=index, index = l)
+            else:
+                yield pd.DataFrame(Y, index=index, columns = l)
         
     def mycontour(self, variable =None, *args,  **kwargs):
         if variable is None: variable = self.variable
-        plt.contour(self.df['x'][0], self.df[variable], np.stack(self.df['y']), *args, **kwargs)
+        l, matrix = self._common()
+        plt.contour(l, self.df[variable], _take_rows(matrix, self.df['row'].to_numpy()), *args, **kwargs)
         cbar = plt.colorbar()
         cbar.set_label('Intensity (count)')
         plt.xlabel(r'$\lambda$ (nm)')
@@ -226,10 +849,11 @@ class SpeFileSet(FileSet):
         if variable is None: variable = self.variable
         vs =self.df[variable]
         colors = get_colors(vs, cmap)
+        l, matrix = self._common()
         i=0
-        for y,v,c in zip(np.stack(self.df['y']), vs ,colors):
+        for y,v,c in zip(_take_rows(matrix, self.df['row'].to_numpy()), vs ,colors):
             if i%(skip+1)==0:
-                plt.plot(self.df['x'][0], y+i*shift, label = v, color = c, *args, **kwargs)
+                plt.plot(l, y+i*shift, label = v, color = c, *args, **kwargs)
             i+=1
         plt.ylabel('Intensity (count)')
         plt.xlabel(r'$\lambda$ (nm)')
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Library of dark/background spectra shared by all files recorded with the same camera settings.
+
+Backgrounds are keyed by exposure time and regions of interest (position, size and binning). Each one is the
+average of all frames of all dark .spe files with that key and is cached on disk, so the dark files are read
+only once. SpeFileSet.flat_field(background=...) subtracts them from the spectra matrix.
+"""
+import os
+import json
+import hashlib
+import numpy as np
+
+from .spereader import SpeFile
+
+BACKGROUND_DIR = os.path.join(os.path.expanduser('~'), 'Documents', 'pca_py_files', 'backgrounds')
+
+ROI_ATTRIBUTES = ('x', 'y', 'width', 'height', 'xBinning', 'yBinning')
+
+
+def background_key(spe):
+    '''
+    Returns (exposure time, ((x, y, width, height, xBinning, yBinning), ...)) of an SpeFile
+    '''
+    rois = tuple(tuple(int(float(region.get(name, 0))) for name in ROI_ATTRIBUTES) for region in spe.roi)
+    return (spe.fields.get('exposure'), rois)
+
+
+def file_key(filepath):
+    '''
+    background_key of a file, read from the footer only for .spe files
+    '''
+    if filepath.lower().endswith('.spe'):
+        return background_key(SpeFile(filepath, header_only=True))
+    from .analysis import _my_spe_loader
+    return background_key(_my_spe_loader(filepath))
+
+
+def _name(key):
+    return json.dumps(key)
+
+
+class BackgroundLibrary:
+    '''
+    Backgrounds by background_key, cached as .npz files in folder
+
+    Parameters
+    ----------
+    folder : TYPE = String, optional
+        DESCRIPTION. The default is None, i.e. BACKGROUND_DIR as it is when the library is made.
+    '''
+    def __init__(self, folder=None):
+        self.folder = BACKGROUND_DIR if folder is None else folder
+        self._entries = None
+
+    def _path(self, key):
+        return os.path.join(self.folder, hashlib.sha1(_name(key).encode()).hexdigest() + '.npz')
+
+    @property
+    def entries(self):
+        '''
+        {key name: (x, y, sources)} of all cached backgrounds, read from folder on first use
+        '''
+        if self._entries is None:
+            self._entries = {}
+            if os.path.isdir(self.folder):
+                for filename in os.listdir(self.folder):
+                    if filename.endswith('.npz'):
+                        with np.load(os.path.join(self.folder, filename)) as entry:
+                            self._entries[str(entry['key'])] = (entry['x'], entry['y'], str(entry['sources']))
+        return self._entries
+
+    def add(self, darks, find_text=''):
+        '''
+        Averages dark .spe files into the library, one background per key. darks is a folder (files whose name
+        contains find_text) or a list of files. A key whose cached background was made from the same files
+        (same paths, sizes and modification times) is not read again.
+        Returns the list of keys found.
+        '''
+        if isinstance(darks, str) and os.path.isdir(darks):
+            darks = [os.path.join(darks, f) for f in sorted(os.listdir(darks))
+                     if f.lower().endswith('.spe') and find_text in f]
+        elif isinstance(darks, str):
+            darks = [darks]
+
+        groups = {}
+        for filepath in darks:
+            groups.setdefault(_name(file_key(filepath)), []).append(filepath)
+
+        for name, filepaths in groups.items():
+            stats = [(os.path.abspath(fp), os.path.getsize(fp), os.stat(fp).st_mtime_ns) for fp in filepaths]
+            sources = json.dumps(sorted(stats))
+            if name in self.entries and self.entries[name][2] == sources:
+                continue
+            total, count = None, 0
+            for filepath in filepaths:
+                x, Y = SpeFile(filepath).get_spectra(dtype=np.float64)
+                total = Y.sum(axis=0) if total is None else total + Y.sum(axis=0)
+                count += len(Y)
+            y = total / count
+            os.makedirs(self.folder, exist_ok=True)
+            np.savez(self._path(json.loads(name)), key=name, x=x, y=y, sources=sources)
+            self.entries[name] = (x, y, sources)
+        return [json.loads(name) for name in groups]
+
+    def get(self, key):
+        '''
+        Returns the background spectrum y for key (see background_key), or None if there is none
+        '''
+        entry = self.entries.get(_name(key))
+        return None if entry is None else entry[1]
+
+    def clear(self):
+        '''
+        Deletes all cached backgrounds
+        '''
+        for name in list(self.entries):
+            path = self._path(json.loads(name))
+            if os.path.exists(path):
+                os.remove(path)
+        self._entries = {}
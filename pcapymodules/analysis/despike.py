@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Removes cosmic-ray spikes from CCD spectra and frames.
+
+Two outlier tests are available, both computed for the whole array at once:
+    despike_frames     compares every pixel with the median of the same pixel over all frames of a kinetic series.
+                       Best when the signal does not change between frames, needs at least 3 frames.
+    despike_neighbors  looks for spikes in the first difference along the pixel (last) axis (Whitaker-Hayes): a step up
+                       and a step down, at most width pixels apart, with much smaller steps just outside of them.
+                       Works on single frames and on a matrix of spectra. Spectral lines rise and fall over several
+                       pixels, so they are left alone down to a FWHM of width + 1 pixels (3 by default).
+Outliers are deviations of more than threshold robust standard deviations (1.4826 x median absolute deviation).
+Spikes are replaced by the median over the frames, or by a straight line between the pixels on either side,
+and a boolean mask of the replaced pixels is returned.
+"""
+import numpy as np
+
+MAD_SCALE = 1.4826
+
+
+def _robust_sigma(residual, axis):
+    deviation = np.abs(residual)
+    sigma = MAD_SCALE * np.nanmedian(deviation, axis=axis, keepdims=True)
+    # Floor from the whole array, leaving out the zero residuals of the median elements themselves,
+    # so that short series (few frames) or flat rows do not make every deviation a spike
+    nonzero = deviation[deviation > 0]
+    floor = MAD_SCALE * np.median(nonzero) if len(nonzero) else 0
+    return np.maximum(sigma, floor if floor > 0 else np.finfo(float).eps)
+
+
+def _replace(data, reference, spikes, out):
+    if out is None:
+        out = np.array(data, copy=True)
+    out[spikes] = reference[spikes].astype(out.dtype) if np.issubdtype(out.dtype, np.floating) \
+        else np.round(reference[spikes]).astype(out.dtype)
+    return out
+
+
+def despike_frames(stack, threshold=6, out=None):
+    '''
+    Parameters
+    ----------
+    stack : TYPE = Array (nframes, ...)
+        DESCRIPTION. Frames of a kinetic series, e.g. an (nframes, ydim, xdim) region of spe_loader.SpeFile.
+    threshold : TYPE = Float, optional
+        DESCRIPTION. The default is 6. Spike threshold in robust standard deviations of the pixel over the frames.
+    out : TYPE = Array, optional
+        DESCRIPTION. The default is None, i.e. a copy of stack. Array to write the cleaned frames into (may be stack).
+
+    Returns
+    -------
+    (cleaned stack, mask of the replaced pixels)
+
+    '''
+    data = np.asarray(stack, dtype=float)
+    if len(data) < 3:
+        raise ValueError('despike_frames needs at least 3 frames, got %i. Use despike_neighbors' % len(data))
+    reference = np.median(data, axis=0, keepdims=True)
+    residual = data - reference
+    spikes = residual > threshold * _robust_sigma(residual, axis=0)
+    reference = np.broadcast_to(reference, data.shape)
+    return _replace(stack, reference, spikes, out), spikes
+
+
+def despike_neighbors(data, threshold=6, width=2, out=None):
+    '''
+    Parameters
+    ----------
+    data : TYPE = Array (..., npixels)
+        DESCRIPTION. A spectrum, a frame or a matrix of spectra. The test runs along the last axis.
+    threshold : TYPE = Float, optional
+        DESCRIPTION. The default is 6. Spike threshold in robust standard deviations of the first difference of each row.
+    width : TYPE = Integer, optional
+        DESCRIPTION. The default is 2. Spikes up to width pixels wide are found. Lines narrower than width + 1 pixels
+        may be taken for spikes.
+    out : TYPE = Array, optional
+        DESCRIPTION. The default is None, i.e. a copy of data. Array to write the cleaned data into (may be data).
+
+    Returns
+    -------
+    (cleaned data, mask of the replaced pixels)
+
+    '''
+    values = np.asarray(data, dtype=float)
+    npixels = values.shape[-1]
+    step = np.diff(values, axis=-1)
+    with np.errstate(invalid='ignore'):
+        limit = threshold * _robust_sigma(step - np.nanmedian(step, axis=-1, keepdims=True), axis=-1)
+    # steps[..., i + width] is the step from pixel i - 1 to pixel i, zero beyond the ends of the row
+    pad = np.zeros(values.shape[:-1] + (width + 1,))
+    steps = np.concatenate([pad, step, pad], axis=-1)
+
+    reference = values.copy()
+    spikes = np.zeros(values.shape, dtype=bool)
+    for k in range(1, width + 1):
+        # runs of k pixels from start to start + k - 1, with a pixel left on either side
+        start = np.arange(1, npixels - k)
+        up = steps[..., start + width]
+        down = -steps[..., start + k + width]
+        edge = np.minimum(up, down)
+        with np.errstate(invalid='ignore'):
+            found = ((up > limit) & (down > limit)
+                     & (np.abs(steps[..., start - 1 + width]) < edge / 2)
+                     & (np.abs(steps[..., start + k + 1 + width]) < edge / 2))
+        for j in range(k):
+            found &= ~spikes[..., start + j]
+        left, right = values[..., start - 1], values[..., start + k]
+        for j in range(k):
+            pixel = start + j
+            reference[..., pixel] = np.where(found, left + (j + 1) / (k + 1) * (right - left), reference[..., pixel])
+            spikes[..., pixel] |= found
+    return _replace(data, reference, spikes, out), spikes
+
+
+if __name__ == "__main__":
+    # Regression check: clean lines of a few pixels FWHM are left unchanged and narrow spikes are removed
+    rng = np.random.default_rng(0)
+    x = np.arange(400.)
+    for fwhm in (3, 5, 12):
+        for center in (200, 200.3, 200.5):
+            line = 5000 * (fwhm / 2) ** 2 / ((x - center) ** 2 + (fwhm / 2) ** 2)
+            spectra = line + rng.normal(0, 10, (100, len(x)))
+            cleaned, mask = despike_neighbors(spectra)
+            assert not mask.any(), 'line of FWHM %g pixels at %g taken for a spike' % (fwhm, center)
+            assert np.array_equal(cleaned, spectra)
+    spectra = 100 + rng.normal(0, 10, (100, len(x)))
+    clean = spectra.copy()
+    pixels = rng.integers(10, len(x) - 10, len(spectra))
+    for row, pixel in enumerate(pixels):
+        spectra[row, pixel:pixel + 1 + row % 2] += rng.uniform(150, 3000)
+    cleaned, mask = despike_neighbors(spectra)
+    assert mask.sum() == sum(1 + row % 2 for row in range(len(spectra)))
+    assert np.abs(cleaned - clean).max() < 100
+    print('despike_neighbors: lines kept, %i spikes removed' % len(spectra))
@@ -1,22 +1,82 @@
 
 import os
 import re
+import copy
+import json
+import threading
+import numpy as np
 import pandas as pd
+from collections import OrderedDict
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from .manifest import get_manifest, FolderManifest
 import tkinter as tk
 from tkinter import filedialog as fdialog
 
+try:
+    import pyarrow
+    CSV_ENGINE = 'pyarrow'
+except ImportError:
+    pyarrow = None
+    CSV_ENGINE = 'c'
+
 '''
 This is a package to load single or multiple files into list, or dictionary in a smarter way.
 The return type dynamically depends on the input type.
 The package also provides way to create panda dataframe from a set of files.
 '''
+NUMBER_RE = re.compile(r"([-+]?(?:\d*\.*\d+))")
+
+# {(folder, header line, detect): schema}, see csv_schema
+_CSV_SCHEMAS = {}
+
+
+def csv_schema(filepath, detect):
+    """
+    Returns detect(filepath), computed only for the first CSV file of a folder with a given header line
+    and reused for the other files of the folder that have the same header.
+    """
+    with open(filepath, newline='', errors='replace') as f:
+        header = f.readline()
+    key = (os.path.dirname(os.path.abspath(filepath)), header, detect)
+    if key not in _CSV_SCHEMAS:
+        _CSV_SCHEMAS[key] = detect(filepath)
+    return _CSV_SCHEMAS[key]
+
+
+def _csv_dtypes(filepath):
+    """Column dtypes of a CSV file, with numeric columns read as float64."""
+    sample = pd.read_csv(filepath, nrows=100)
+    return {column: (np.float64 if pd.api.types.is_numeric_dtype(dtype) else dtype)
+            for column, dtype in sample.dtypes.items()}
+
+
+def read_csv_fast(filepath, usecols=None):
+    """
+    Reads a CSV file with the column dtypes detected once per folder (csv_schema) and the pyarrow engine
+    if it is installed. Numeric columns are float64. Falls back to a plain pd.read_csv if a file does not
+    follow the detected schema, e.g. text in a column that was empty (hence float64) in the first file.
+    The dtypes are then detected from the file itself.
+    """
+    dtypes = csv_schema(filepath, _csv_dtypes)
+    if usecols is not None:
+        dtypes = {column: dtypes[column] for column in usecols if column in dtypes}
+    try:
+        return pd.read_csv(filepath, usecols=usecols, dtype=dtypes, engine=CSV_ENGINE)
+    except (ValueError, TypeError):
+        df = pd.read_csv(filepath, usecols=usecols)
+        numeric = [column for column in df.columns if pd.api.types.is_numeric_dtype(df[column])]
+        df[numeric] = df[numeric].astype(np.float64)
+        return df
+
+
 class MyFile:
     """Generic wrapper for simple tabular files (default: CSV)."""
     def __init__(self, filepath):
         self.filepath = filepath
         root, ext = os.path.splitext(filepath)
         if ext.lower() == ".csv":
-            self.data = pd.read_csv(filepath)
+            self.data = read_csv_fast(filepath)
         else:
             raise ValueError(f"Unrecognized file type for MyFile: {filepath}")
 
@@ -24,6 +84,66 @@ def default_loader(filepath):
     """Default loader: use MyFile for CSV."""
     return MyFile(filepath)
 
+
+class LRUCache:
+    """Thread-safe cache keeping at most `maxsize` loaded objects, dropping the least recently used first."""
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, loader):
+        """Returns the object cached under key, loading it with loader(key) on a miss."""
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        value = loader(key)
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return value
+
+    def discard(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __getstate__(self):
+        # Pickled (e.g. for a process pool) as an empty cache
+        return {'maxsize': self.maxsize}
+
+    def __setstate__(self, state):
+        self.__init__(state['maxsize'])
+
+
+class LazyFile:
+    """
+    Cheap stand-in for a loaded file. Only the filepath is stored; the file is loaded with `loader`
+    on first access to any other attribute and kept in the shared LRUCache `cache`.
+    """
+    def __init__(self, filepath, loader=default_loader, cache=None):
+        self.filepath = filepath
+        self._loader = loader
+        self._cache = cache if cache is not None else LRUCache(1)
+
+    def load(self):
+        """Returns the loaded file object."""
+        return self._cache.get(self.filepath, self._loader)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __repr__(self):
+        return 'LazyFile(%r)' % self.filepath
+
     
 class FileSet:
     '''
@@ -31,27 +151,65 @@ class FileSet:
         DESCRIPTION: In this case it will load files under the folder using load_function
     pattern: A dictionary of pattern where key is the variable name and pattern is to match and extract values of the variable from the filename.
         DESCRIPTION: The pattern should be compatible to the python package re.
+    workers: TYPE: Integer or None
+        DESCRIPTION: Number of parallel workers used to load the files. None loads them one by one.
+        Files keep the same order as a sequential load.
+    processes: TYPE: Boolean
+        DESCRIPTION: Use a process pool instead of a thread pool. The loader and the loaded objects must be picklable.
+    lazy: TYPE: Boolean
+        DESCRIPTION: If True, column 0 holds LazyFile proxies that load their file on first attribute access.
+        At most max_resident loaded files are kept in memory (self.cache).
+    manifest: TYPE: Boolean
+        DESCRIPTION: If True, folders are listed, filtered and their pattern variables decoded through the
+        persistent folder index of the manifest module instead of listing the folder every time.
+        The index of each folder is updated once when the FileSet is built and again on refresh.
+    max_age: TYPE: Float
+        DESCRIPTION: With manifest, a folder index younger than max_age seconds is used without rescanning the folder.
+
+    refresh() loads only the files that were added to the folders or changed since the FileSet was built.
+    save(path) writes the FileSet into a folder and FileSet.open(path) reopens it without the raw files.
+    select(**ranges) and nearest(**values) look variables up in sorted indexes and return subsets of the FileSet.
+    After editing a variable column of df in place, call reindex() to drop these indexes.
     '''
     def __init__(self, files, pattern=None, find_text='', filenames=None,
-                 file_type='.csv', loader=default_loader):
+                 file_type='.csv', loader=default_loader, workers=None, processes=False,
+                 lazy=False, max_resident=32, manifest=False, max_age=0):
+        self._indexes = {}; self._index_df = None; self._parent = None
+        self.workers = workers
+        self.manifest = manifest
+        self.max_age = max_age
+        self._manifests = {}
+        self.processes = processes
+        self.cache = None
+        if lazy:
+            self.cache = LRUCache(max_resident)
+            loader = partial(LazyFile, loader=loader, cache=self.cache)
+            workers = None
+        self.loader = loader
+        self.pattern = pattern
+        self.find_text = find_text
+        self.file_type = file_type
+        self._sources = [files] if isinstance(files, str) else (list(files) if is_list_of_strings(files) else [])
+        self._stats = {}
+        stats = self._scan()
+
         if isinstance(files, str):
             # Single folder or file
             if os.path.isdir(files):
-                files = load_files(files, find_text, file_type=file_type, loader=loader)
+                files = _map(loader, self._listing[files], workers, processes)
+                print('Successfully loaded %i file(s) in a list of %s File objects' % (len(files), file_type))
             else:
                 files = [loader(files)]
         elif is_list_of_strings(files):
-            collected = []
+            paths = []
             for item in files:
                 if os.path.isdir(item):
                     # Treat as folder
-                    collected.extend(
-                        load_files(item, find_text, file_type=file_type, loader=loader)
-                    )
+                    paths.extend(self._listing[item])
                 else:
                     # Treat as single file
-                    collected.append(loader(item))
-            files = collected
+                    paths.append(item)
+            files = _map(loader, paths, workers, processes)
 
         if not files:
             raise ValueError("No files loaded into the FileSet.")
@@ -63,7 +221,268 @@ class FileSet:
 
         if pattern is not None:
             self._decode_pattern(pattern)
+
+        for file in self.df.iloc[:,0]:
+            self._stats[file.filepath] = stats.get(file.filepath) or _file_stat(file.filepath)
+
+    def _manifest(self, folder, update=False):
+        """
+        Returns the FolderManifest of folder. It is fetched (and so updated) once per FileSet, and afterwards only
+        updated again if update is True.
+        """
+        if folder not in self._manifests:
+            self._manifests[folder] = get_manifest(folder, max_age=self.max_age)
+        elif update:
+            self._manifests[folder].update()
+        return self._manifests[folder]
+
+    def _scan(self):
+        """
+        Returns {filepath: (size, mtime)} for the matching files in the source folders and for all files already loaded.
+        The matching paths of each source folder are kept in self._listing, so that the folder is listed only once.
+        """
+        found = {}
+        self._listing = {}
+        for source in self._sources:
+            if os.path.isdir(source) and self.manifest:
+                index = self._manifest(source, update=True)
+                matching = index.files(self.find_text, self.file_type)
+                self._listing[source] = matching
+                matching = set(matching)
+                table = index.table()
+                for path, size, mtime in zip(table['path'], table['size'], table['mtime']):
+                    filepath = os.path.join(source, path)
+                    if filepath in matching:
+                        found[filepath] = (int(size), int(mtime))
+            elif os.path.isdir(source):
+                self._listing[source] = []
+                with os.scandir(source) as entries:
+                    for entry in entries:
+                        if (entry.name.lower().endswith(self.file_type.lower()) and re.search(self.find_text, entry.name)
+                                and entry.is_file()):
+                            stat = entry.stat()
+                            found[entry.path] = (stat.st_size, stat.st_mtime_ns)
+                            self._listing[source].append(entry.path)
+            elif source not in found:
+                found[source] = _file_stat(source)
+        for filepath in self._stats:
+            if filepath not in found:
+                found[filepath] = _file_stat(filepath)
+        return {filepath: stat for filepath, stat in found.items() if stat is not None}
+
+    def refresh(self):
+        """
+        Rescans the source folders and loads only new files and files whose size or modification time changed.
+        New files are appended to df; changed files are reloaded in their row. Rows of deleted files are kept.
+        """
+        added, changed = self._refresh_files()
+        print('Refreshed: %i new and %i changed file(s)' % (len(added), len(changed)))
+        return self
+
+    def _refresh_files(self):
+        """
+        Does the work of refresh and returns the df index labels of the added and of the changed rows.
+        """
+        found = self._scan()
+        new_paths = [fp for fp in found if fp not in self._stats]
+        changed_paths = [fp for fp in found if fp in self._stats and found[fp] != self._stats[fp]]
+
+        labels = {file.filepath: label for label, file in self.df.iloc[:,0].items()}
+        changed = [labels[fp] for fp in changed_paths if fp in labels]
+        if self.cache is not None:
+            for fp in changed_paths:
+                self.cache.discard(fp)
+        for label, file in zip(changed, _map(self.loader, [self.df.at[label, 0].filepath for label in changed],
+                                             self.workers, self.processes)):
+            self.df.at[label, 0] = file
+
+        added = []
+        if new_paths:
+            start = self.df.index.max() + 1
+            added = list(range(start, start + len(new_paths)))
+            new = pd.DataFrame({0: _map(self.loader, new_paths, self.workers, self.processes)}, index=added)
+            new['filename'] = [os.path.basename(fp) for fp in new_paths]
+            new['no'] = range(self.df['no'].max() + 1, self.df['no'].max() + 1 + len(new))
+            if self.pattern is not None:
+                self._decode_pattern(self.pattern, new)
+            self.df = pd.concat([self.df, new])
+
+        for fp in new_paths + changed_paths:
+            self._stats[fp] = found[fp]
+        return added, changed
             
+    def save(self, path):
+        """
+        Saves the FileSet into the folder path:
+            metadata.parquet  the DataFrame without the file objects, with their paths in the column 'filepath'
+            <name>.npy        the arrays returned by _arrays (e.g. the spectra), memory mapped by open
+            fileset.json      pattern, sources and the other attributes needed to reopen it
+        The metadata is pickled (metadata.pkl) if no parquet engine (pyarrow) is installed.
+        """
+        os.makedirs(path, exist_ok=True)
+        arrays, columns, state = self._arrays()
+        df = self.df.drop(columns=[0] + columns)
+        df.insert(0, 'filepath', [file.filepath for file in self.df.iloc[:,0]])
+        try:
+            df.to_parquet(os.path.join(path, 'metadata.parquet'))
+            table = 'metadata.parquet'
+        except ImportError:
+            print('PCA WARNING: no parquet engine installed (pip install pyarrow), the metadata is saved as a pickle')
+            df.to_pickle(os.path.join(path, 'metadata.pkl'))
+            table = 'metadata.pkl'
+        for name, array in arrays.items():
+            np.save(os.path.join(path, name + '.npy'), np.ascontiguousarray(array))
+        info = {'class': type(self).__name__, 'table': table, 'arrays': list(arrays), 'state': state,
+                'variable': self.variable, 'pattern': self.pattern, 'find_text': self.find_text,
+                'file_type': self.file_type, 'sources': self._sources,
+                'stats': [[filepath, list(stat)] for filepath, stat in self._stats.items()]}
+        with open(os.path.join(path, 'fileset.json'), 'w') as f:
+            json.dump(info, f, indent=1)
+        return path
+
+    @classmethod
+    def open(cls, path, mmap=True, loader=default_loader, max_resident=32):
+        """
+        Reopens a FileSet written by save. The arrays are memory mapped copy-on-write if mmap is True, so
+        processing the reopened set does not change the saved one. Column 0 holds LazyFile proxies, so the raw
+        files are only needed when a file object itself is used (or for refresh).
+        """
+        with open(os.path.join(path, 'fileset.json')) as f:
+            info = json.load(f)
+        if info['class'] != cls.__name__:
+            print('PCA WARNING: %s was saved from a %s, opening it as a %s' % (path, info['class'], cls.__name__))
+        self = cls.__new__(cls)
+        self._indexes = {}; self._index_df = None; self._parent = None
+        self.workers = None
+        self.processes = False
+        self.manifest = False
+        self.max_age = 0
+        self._manifests = {}
+        self.cache = LRUCache(max_resident)
+        self.loader = partial(LazyFile, loader=loader, cache=self.cache)
+        self.pattern = info['pattern']
+        self.find_text = info['find_text']
+        self.file_type = info['file_type']
+        self.variable = info['variable']
+        self._sources = info['sources']
+        self._stats = {filepath: tuple(stat) for filepath, stat in info['stats']}
+
+        table = os.path.join(path, info['table'])
+        df = pd.read_parquet(table) if table.endswith('.parquet') else pd.read_pickle(table)
+        df.insert(0, 0, [self.loader(filepath) for filepath in df.pop('filepath')])
+        self.df = df
+        arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='c' if mmap else None)
+                  for name in info['arrays']}
+        self._restore(arrays, info['state'])
+        return self
+
+    def _arrays(self):
+        """
+        Returns ({name: array} to save, DataFrame columns they replace, json serializable state for _restore).
+        Columns holding one numpy array per file are saved concatenated, with the end offset of every row.
+        """
+        arrays, columns = {}, []
+        for column in self.df.columns[1:]:
+            values = self.df[column]
+            if values.dtype == object and len(values) and all(isinstance(v, np.ndarray) and v.ndim == 1 for v in values):
+                arrays[str(column)] = np.concatenate(values.tolist())
+                arrays[str(column) + '_offsets'] = np.cumsum([len(v) for v in values])
+                columns.append(column)
+        return arrays, columns, {'columns': [str(column) for column in columns]}
+
+    def _restore(self, arrays, state):
+        """
+        Puts back the DataFrame columns saved by _arrays, as views of the (memory mapped) arrays.
+        """
+        for column in state['columns']:
+            ends = arrays[column + '_offsets']
+            starts = np.concatenate([[0], ends[:-1]])
+            self.df[column] = [arrays[column][start:end] for start, end in zip(starts, ends)]
+
+    def _sorted_index(self, variable):
+        """
+        Returns (sorted values, df positions in that order) of the column variable.
+        Indexes are built on first use and kept until self.df is replaced or changes length, the pattern is
+        decoded again or reindex() is called.
+        """
+        if self._index_df is not self.df or self._index_length != len(self.df):
+            self.reindex()
+        if variable not in self._indexes:
+            values = self.df[variable].to_numpy(dtype=float)
+            order = np.argsort(values, kind='stable')
+            self._indexes[variable] = (values[order], order)
+        return self._indexes[variable]
+
+    def reindex(self):
+        """
+        Drops the sorted indexes of select and nearest. Call it after editing a variable column of self.df in place,
+        e.g. self.df.loc[rows, 'B'] = values.
+        """
+        self._indexes = {}; self._index_df = self.df; self._index_length = len(self.df)
+
+    def _positions(self, variable, condition):
+        """
+        df positions, in sorted order of variable, of the rows where variable matches condition:
+        (low, high) for low <= value <= high (None for an open end), a list of values or a single value.
+        """
+        values, order = self._sorted_index(variable)
+        if isinstance(condition, tuple):
+            low, high = condition
+            start = 0 if low is None else np.searchsorted(values, low, 'left')
+            stop = np.searchsorted(values, np.inf if high is None else high, 'right')
+            return order[start:stop]
+        if isinstance(condition, (list, set, np.ndarray)):
+            return np.concatenate([order[np.searchsorted(values, value, 'left'):np.searchsorted(values, value, 'right')]
+                                   for value in sorted(condition)] or [np.array([], dtype=int)])
+        return order[np.searchsorted(values, condition, 'left'):np.searchsorted(values, condition, 'right')]
+
+    def select(self, **conditions):
+        """
+        Returns the subset of files matching all conditions, in the order of the first variable,
+        e.g. select(B=(1.2, 1.5), pol=45) or select(T=[4, 10, 300]). Each condition is
+            (low, high) : low <= value <= high, with None for an open end
+            list        : value is one of the list
+            value       : value equals it
+        Lookups are binary searches in sorted indexes. The subset shares the file objects (and spectra)
+        with this FileSet instead of copying them.
+        """
+        positions = None
+        for variable, condition in conditions.items():
+            found = self._positions(variable, condition)
+            positions = found if positions is None else positions[np.isin(positions, found)]
+        if positions is None:
+            positions = np.arange(len(self.df))
+        return self._subset(positions)
+
+    def nearest(self, **values):
+        """
+        Returns the subset of files whose variables are closest to values, e.g. nearest(B=1.23).
+        Variables are matched one after another, each among the files left by the previous ones.
+        """
+        subset = self
+        for variable, value in values.items():
+            sorted_values, _ = subset._sorted_index(variable)
+            sorted_values = sorted_values[~np.isnan(sorted_values)]
+            if not len(sorted_values):
+                return subset._subset(np.array([], dtype=int))
+            i = np.searchsorted(sorted_values, value)
+            candidates = sorted_values[max(i - 1, 0):i + 1]
+            subset = subset.select(**{variable: candidates[np.argmin(np.abs(candidates - value))]})
+        return subset
+
+    def _subset(self, positions):
+        """
+        Shallow copy of the FileSet restricted to the df rows at positions. A contiguous run of rows is taken as a slice.
+        The subset keeps this FileSet as its _parent.
+        """
+        subset = copy.copy(self)
+        subset._indexes = {}; subset._index_df = None; subset._parent = self
+        if len(positions) and positions[-1] - positions[0] == len(positions) - 1 and np.all(np.diff(positions) == 1):
+            subset.df = self.df.iloc[positions[0]:positions[-1] + 1]
+        else:
+            subset.df = self.df.iloc[positions]
+        return subset
+
     def _update_filename(self, filenames):
         if filenames is None:
             filenames = []
@@ -84,18 +503,43 @@ class FileSet:
                 r+=1
     '''
         
-    def _decode_pattern(self, pattern): 
-        i=0
-        for key in pattern:
+    def _decode_pattern(self, pattern, df=None): 
+        """
+        Extracts the number matched by each pattern[key] in every filename of df (default self.df) into the column key.
+        Filenames that do not match become NaN and are reported.
+        """
+        if df is None: df = self.df
+        if df is self.df: self.reindex()
+        filenames = df['filename'].astype(str)
+        indexed = self._manifest_variables(pattern, df) if self.manifest else None
+        for i, key in enumerate(pattern):
             if i==0: self.variable = key
-            val_list =[]
-            for filename in self.df['filename']:
-                res = re.search(pattern[key], filename)
-                res = re.search(r"[-+]?(?:\d*\.*\d+)", res.group())
-                number = float(res.group())
-                val_list.append(number)
-            self.df[key]=val_list
-            i+=1
+            if indexed is not None:
+                df[key] = indexed[key].to_numpy()
+            else:
+                matches = filenames.str.extract(re.compile('(%s)' % pattern[key]), expand=True)[0]
+                numbers = matches.str.extract(NUMBER_RE, expand=False)
+                df[key] = pd.to_numeric(numbers, errors='coerce').astype(float)
+            unmatched = df.loc[df[key].isna(), 'filename']
+            if len(unmatched):
+                print('PCA WARNING: pattern %r for %s did not match %i file(s): %s'
+                      % (pattern[key], key, len(unmatched), ', '.join(unmatched.astype(str))))
+        
+    
+    def _manifest_variables(self, pattern, df):
+        """
+        Returns the pattern variables of the files in df from the folder manifests, or None if some file is not indexed
+        (e.g. it was given as a single file) or filenames were given explicitly.
+        """
+        tables = [self._manifest(source).variables(pattern) for source in self._sources if os.path.isdir(source)]
+        filepaths = [file.filepath for file in df.iloc[:,0]]
+        if not tables or list(df['filename']) != [os.path.basename(fp) for fp in filepaths]:
+            return None
+        table = pd.concat(tables)
+        table = table[~table.index.duplicated()]
+        if not set(filepaths) <= set(table.index):
+            return None
+        return table.loc[filepaths]
         
     
 def get_file_set (folders, **kwargs):
@@ -129,6 +573,46 @@ def is_list_of_strings(obj):
     return True
     
     
+def _map(function, items, workers=None, processes=False):
+    """
+    Returns [function(item) for item in items], computed in a thread pool (or a process pool if processes is True)
+    when workers is more than 1. The order of items is kept.
+    """
+    items = list(items)
+    if not workers or workers == 1 or len(items) < 2:
+        return [function(item) for item in items]
+    executor_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor_class(max_workers=workers) as executor:
+        return list(executor.map(function, items))
+
+
+def _file_stat(filepath):
+    """
+    Returns (size, mtime) of a file, or None if it does not exist.
+    """
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def _folder_files(folder, find_text='', file_type='.csv', manifest=False, max_age=0):
+    """
+    Returns the paths of files in folder with extension file_type and a name matching find_text.
+    With manifest=True (or the FolderManifest of folder itself) they are read from the folder manifest (in name order).
+    """
+    if isinstance(manifest, FolderManifest):
+        return manifest.files(find_text, file_type)
+    if manifest:
+        return get_manifest(folder, max_age=max_age).files(find_text, file_type)
+    paths = []
+    for f in os.listdir(folder):
+        if f.lower().endswith(file_type.lower()) and re.search(find_text, f):
+            paths.append(os.path.join(folder, f))
+    return paths
+
+
 def get_files(mult=False):
     """
     Uses tkinter to allow UI source file selection
@@ -142,7 +626,8 @@ def get_files(mult=False):
     root.destroy()
     return filepaths
 
-def load_files(filepaths=None, find_text = '', file_type='.csv', loader = default_loader):
+def load_files(filepaths=None, find_text = '', file_type='.csv', loader = default_loader, workers=None, processes=False,
+               manifest=False, max_age=0):
     """
     Allows user to load multiple files at once. Each file is wrapped by the
     provided `loader` callable (default: MyFile for CSV).
@@ -153,11 +638,17 @@ def load_files(filepaths=None, find_text = '', file_type='.csv', loader = defaul
         - None: open a file dialog
         - str (file or folder): load that path
         - list/dict of str: load multiple paths
+    workers: int | None
+        Number of parallel workers (thread pool, or process pool if processes=True). None loads sequentially.
+    manifest: bool
+        List folders through the persistent folder manifest (see manifest.FolderManifest).
+    max_age: float
+        With manifest, use a folder index younger than max_age seconds without rescanning the folder.
     """
     # GUI file picker
     if filepaths is None:
         filepaths = get_files(True)
-        batch = [loader(fp) for fp in filepaths]
+        batch = _map(loader, filepaths, workers, processes)
         return_type = "list of %s File objects" % file_type
         if len(batch) == 1:
             batch = batch[0]
@@ -167,11 +658,12 @@ def load_files(filepaths=None, find_text = '', file_type='.csv', loader = defaul
 
     # List of paths
     elif isinstance(filepaths, list):
-        batch = []
+        selected = []
         for fp in filepaths:
             fname = os.path.basename(fp)
             if find_text in fp and re.search(file_type, fname):
-                batch.append(loader(fp))
+                selected.append(fp)
+        batch = _map(loader, selected, workers, processes)
 
         count = len(batch)
         return_type = "list of %s File objects" % file_type
@@ -185,21 +677,15 @@ def load_files(filepaths=None, find_text = '', file_type='.csv', loader = defaul
 
     # Dict of paths
     elif isinstance(filepaths, dict):
-        batch = {}
-        for key, fp in filepaths.items():
-            if find_text in fp:
-                batch[key] = loader(fp)
+        selected = {key: fp for key, fp in filepaths.items() if find_text in fp}
+        batch = dict(zip(selected, _map(loader, selected.values(), workers, processes)))
         return_type = "dictionary of %s File objects" % file_type
         print('Successfully loaded %i file(s) in a %s' % (len(batch), return_type))
         return batch
 
     # Folder path
     elif os.path.isdir(filepaths):
-        files = []
-        for f in os.listdir(filepaths):
-            if f.lower().endswith(file_type.lower()) and re.search(find_text, f):
-                full = os.path.join(filepaths, f)
-                files.append(loader(full))
+        files = _map(loader, _folder_files(filepaths, find_text, file_type, manifest, max_age), workers, processes)
         return_type = "list of %s File objects" % file_type
         print('Successfully loaded %i file(s) in a %s' % (len(files), return_type))
         return files
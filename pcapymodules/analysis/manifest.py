@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent per-folder index of data files.
+
+A FolderManifest keeps path, size, modification time, file tag, first number and decoded pattern variables
+of every file in a folder in a SQLite sidecar file. update() only stats the folder and writes the difference,
+and listing, filtering and pattern lookups are then answered from the index instead of walking the folder again.
+"""
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+from functools import wraps
+import pandas as pd
+
+MANIFEST_NAME = '.pcapy_manifest.sqlite'
+# Used when the data folder itself is not writable
+MANIFEST_DIR = os.path.join(os.path.expanduser('~'), 'Documents', 'pca_py_files', 'manifests')
+
+TAG_RE = re.compile(r'^(\[[^\]-]+-[^\]-]+-\d+\])')
+FIRST_NUMBER_RE = re.compile(r'\d+')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, name TEXT, size INTEGER, mtime INTEGER,
+                                  tag TEXT, number INTEGER);
+CREATE TABLE IF NOT EXISTS variables (path TEXT, pattern TEXT, value REAL, PRIMARY KEY (path, pattern));
+CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value REAL);
+'''
+
+
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+
+def get_manifest(folder, recursive=False, max_age=0):
+    '''
+    Returns the FolderManifest of folder, reusing the one already opened in this session, after updating it.
+    '''
+    key = (os.path.abspath(folder), recursive)
+    with _manifests_lock:
+        if key not in _manifests:
+            _manifests[key] = FolderManifest(folder, recursive, max_age)
+            return _manifests[key]
+        manifest = _manifests[key]
+    manifest.max_age = max_age
+    manifest.update()
+    return manifest
+
+
+def _suffix(file_type):
+    # LIKE pattern matching names that end with file_type
+    return '%' + file_type.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _regexp(pattern, text):
+    return re.search(pattern, text) is not None
+
+
+def _locked(method):
+    # FolderManifests are shared by all FileSets of the session, possibly from several threads (e.g. a live
+    # refresh in a worker thread), so each use of the connection holds the manifest lock
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return locked
+
+
+class FolderManifest:
+    '''
+    Index of the files in a folder
+
+    Parameters
+    ----------
+    folder : TYPE = String
+        DESCRIPTION. Folder to index.
+    recursive : TYPE = Boolean, optional
+        DESCRIPTION. The default is False. Also index sub folders (paths are then relative to folder).
+    max_age : TYPE = Float, optional
+        DESCRIPTION. The default is 0. update() skips rescanning if the last scan is younger than max_age seconds,
+        which helps on network shares where listing a folder is slow.
+    '''
+    def __init__(self, folder, recursive=False, max_age=0):
+        self.folder = folder
+        self.recursive = recursive
+        self.max_age = max_age
+        self.path = self._manifest_path()
+        self._lock = threading.RLock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.create_function('REGEXP', 2, _regexp, deterministic=True)
+        self.db.executescript(_SCHEMA)
+        self.update()
+
+    def _manifest_path(self):
+        name = MANIFEST_NAME if not self.recursive else MANIFEST_NAME.replace('.sqlite', '_recursive.sqlite')
+        path = os.path.join(self.folder, name)
+        if os.access(self.folder, os.W_OK):
+            return path
+        os.makedirs(MANIFEST_DIR, exist_ok=True)
+        return os.path.join(MANIFEST_DIR, hashlib.sha1(os.path.abspath(path).encode()).hexdigest() + '.sqlite')
+
+    def _scan(self, folder, prefix=''):
+        for entry in os.scandir(folder):
+            if entry.name.startswith(MANIFEST_NAME.split('.sqlite')[0]):
+                continue
+            if entry.is_file():
+                stat = entry.stat()
+                yield prefix + entry.name, entry.name, stat.st_size, stat.st_mtime_ns
+            elif self.recursive and entry.is_dir():
+                yield from self._scan(entry.path, prefix + entry.name + '/')
+
+    @_locked
+    def update(self, force=False):
+        '''
+        Rescans the folder and writes only new, changed and deleted files into the index.
+        Returns the numbers of (new, changed, deleted) files.
+        '''
+        last = self.db.execute("SELECT value FROM info WHERE key = 'scanned'").fetchone()
+        if not force and last is not None and time.time() - last[0] < self.max_age:
+            return (0, 0, 0)
+
+        known = {path: (size, mtime) for path, size, mtime in self.db.execute('SELECT path, size, mtime FROM files')}
+        new, changed = [], []
+        for path, name, size, mtime in self._scan(self.folder):
+            if path not in known:
+                new.append(path)
+            elif known.pop(path) != (size, mtime):
+                changed.append(path)
+            else:
+                continue
+            tag = TAG_RE.match(name)
+            number = FIRST_NUMBER_RE.search(name)
+            self.db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)',
+                            (path, name, size, mtime, tag.group(1) if tag else None,
+                             int(number.group()) if number else None))
+        deleted = [(path,) for path in known]
+        self.db.executemany('DELETE FROM files WHERE path = ?', deleted)
+        self.db.executemany('DELETE FROM variables WHERE path = ?', deleted)
+        self.db.execute("INSERT OR REPLACE INTO info VALUES ('scanned', ?)", (time.time(),))
+        self.db.commit()
+        return (len(new), len(changed), len(deleted))
+
+    @_locked
+    def files(self, find_text='', file_type=''):
+        '''
+        Returns the full paths of indexed files whose name ends with file_type (case insensitive)
+        and matches the regular expression find_text, in name order.
+        '''
+        rows = self.db.execute("SELECT path FROM files WHERE lower(name) LIKE ? ESCAPE '\\' AND name REGEXP ? ORDER BY name, path",
+                               (_suffix(file_type), find_text))
+        return [os.path.join(self.folder, path) for path, in rows]
+
+    @_locked
+    def table(self):
+        '''
+        Returns the index as a DataFrame with columns path, name, size, mtime, tag and number
+        '''
+        return pd.read_sql_query('SELECT * FROM files ORDER BY name, path', self.db)
+
+    @_locked
+    def first_numbers(self, file_type=''):
+        '''
+        Returns {first number in the filename: filename} for indexed files ending with file_type
+        '''
+        rows = self.db.execute("SELECT number, path FROM files WHERE number IS NOT NULL AND lower(name) LIKE ? ESCAPE '\\' ORDER BY rowid",
+                               (_suffix(file_type),))
+        return {number: path for number, path in rows}
+
+    @_locked
+    def variables(self, pattern, find_text='', file_type=''):
+        '''
+        Returns a DataFrame indexed by full path with one column per key of pattern, holding the number matched by
+        pattern[key] in the filename (NaN if it does not match). Values are computed once per file and pattern
+        and then read from the index.
+        '''
+        from .loadfile import NUMBER_RE  # loadfile imports this module
+        paths = [path for path, in self.db.execute(
+            "SELECT path FROM files WHERE lower(name) LIKE ? ESCAPE '\\' AND name REGEXP ? ORDER BY name, path",
+            (_suffix(file_type), find_text))]
+        result = pd.DataFrame(index=[os.path.join(self.folder, path) for path in paths])
+        for key, regex in pattern.items():
+            cached = dict(self.db.execute('SELECT path, value FROM variables WHERE pattern = ?', (regex,)))
+            missing = [path for path in paths if path not in cached]
+            if missing:
+                compiled = re.compile(regex)
+                rows = []
+                for path in missing:
+                    match = compiled.search(os.path.basename(path))
+                    number = NUMBER_RE.search(match.group()) if match else None
+                    rows.append((path, regex, float(number.group()) if number else None))
+                self.db.executemany('INSERT OR REPLACE INTO variables VALUES (?, ?, ?)', rows)
+                self.db.commit()
+                cached.update((path, value) for path, _, value in rows)
+            result[key] = [cached[path] for path in paths]
+        return result.astype(float)
+
+    @_locked
+    def close(self):
+        self.db.close()
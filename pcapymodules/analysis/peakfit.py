@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Fits one peak per spectrum over a whole SpeFileSet.
+
+Line shapes are written for broadcasting: evaluated with a (k,) parameter vector they return one curve,
+with an (n, k) parameter matrix they return n curves at once. Each comes with its analytic Jacobian, which
+least_squares uses instead of finite differences.
+
+Parameters of every model are amplitude, center, fwhm and offset (and eta, the Lorentzian fraction,
+for the pseudo-Voigt). The amplitude is the height of the peak above the offset.
+"""
+import numpy as np
+import pandas as pd
+from functools import partial
+from scipy.optimize import least_squares
+
+from .loadfile import _map
+
+LN2 = np.log(2)
+
+
+def _split(p):
+    # Columns of a (..., k) parameter array, shaped to broadcast against x
+    p = np.asarray(p, dtype=float)
+    return [p[..., i, None] for i in range(p.shape[-1])]
+
+
+def _lorentz(x, center, fwhm):
+    d = x - center
+    h2 = (fwhm / 2) ** 2
+    D = d ** 2 + h2
+    # value, derivative along center, derivative along fwhm
+    return h2 / D, 2 * h2 * d / D ** 2, fwhm / 2 * d ** 2 / D ** 2
+
+
+def _gauss(x, center, fwhm):
+    d = x - center
+    g = np.exp(-4 * LN2 * d ** 2 / fwhm ** 2)
+    return g, 8 * LN2 * d / fwhm ** 2 * g, 8 * LN2 * d ** 2 / fwhm ** 3 * g
+
+
+def lorentzian(x, p):
+    amplitude, center, fwhm, offset = _split(p)
+    return amplitude * _lorentz(x, center, fwhm)[0] + offset
+
+
+def lorentzian_jac(x, p):
+    amplitude, center, fwhm, offset = _split(p)
+    g, dc, dw = _lorentz(x, center, fwhm)
+    return np.stack(np.broadcast_arrays(g, amplitude * dc, amplitude * dw, np.ones_like(g)), axis=-1)
+
+
+def gaussian(x, p):
+    amplitude, center, fwhm, offset = _split(p)
+    return amplitude * _gauss(x, center, fwhm)[0] + offset
+
+
+def gaussian_jac(x, p):
+    amplitude, center, fwhm, offset = _split(p)
+    g, dc, dw = _gauss(x, center, fwhm)
+    return np.stack(np.broadcast_arrays(g, amplitude * dc, amplitude * dw, np.ones_like(g)), axis=-1)
+
+
+def pseudo_voigt(x, p):
+    amplitude, center, fwhm, eta, offset = _split(p)
+    return amplitude * ((1 - eta) * _gauss(x, center, fwhm)[0] + eta * _lorentz(x, center, fwhm)[0]) + offset
+
+
+def pseudo_voigt_jac(x, p):
+    amplitude, center, fwhm, eta, offset = _split(p)
+    g, g_dc, g_dw = _gauss(x, center, fwhm)
+    l, l_dc, l_dw = _lorentz(x, center, fwhm)
+    shape = (1 - eta) * g + eta * l
+    return np.stack(np.broadcast_arrays(shape, amplitude * ((1 - eta) * g_dc + eta * l_dc),
+                                        amplitude * ((1 - eta) * g_dw + eta * l_dw),
+                                        amplitude * (l - g), np.ones_like(g)), axis=-1)
+
+
+# name: (function, jacobian, parameter names)
+MODELS = {'lorentzian': (lorentzian, lorentzian_jac, ['amplitude', 'center', 'fwhm', 'offset']),
+          'gaussian': (gaussian, gaussian_jac, ['amplitude', 'center', 'fwhm', 'offset']),
+          'voigt': (pseudo_voigt, pseudo_voigt_jac, ['amplitude', 'center', 'fwhm', 'eta', 'offset'])}
+
+
+def _model(model):
+    if model not in MODELS:
+        raise ValueError('model should be one of %s, got %r' % (list(MODELS), model))
+    return MODELS[model]
+
+
+def _bounds(x, names):
+    step = np.min(np.abs(np.diff(x))) if len(x) > 1 else 1.0
+    span = np.ptp(x)
+    lower = {'amplitude': -np.inf, 'center': np.min(x), 'fwhm': step / 10, 'eta': 0, 'offset': -np.inf}
+    upper = {'amplitude': np.inf, 'center': np.max(x), 'fwhm': 2 * span, 'eta': 1, 'offset': np.inf}
+    return [lower[name] for name in names], [upper[name] for name in names]
+
+
+def guess(x, y, model='lorentzian'):
+    '''
+    Starting parameters from the data: offset at the minimum, center at the maximum and fwhm from the number
+    of points above half maximum.
+    '''
+    names = _model(model)[2]
+    offset = np.nanmin(y)
+    amplitude = np.nanmax(y) - offset
+    center = x[np.nanargmax(y)]
+    step = np.abs(np.mean(np.diff(x))) if len(x) > 1 else 1.0
+    fwhm = max(np.sum(y - offset >= amplitude / 2), 2) * step
+    values = {'amplitude': amplitude, 'center': center, 'fwhm': fwhm, 'eta': 0.5, 'offset': offset}
+    return np.array([values[name] for name in names])
+
+
+def _fit_chunk(chunk, x, model):
+    '''
+    Fits the rows of the (n, npix) chunk one after another. Every fit starts from the result of the previous row
+    (warm start), or from guess if that fit failed or the maximum moved by more than a fwhm from its center.
+    Returns an (n, k + 2) array of parameters, cost and success.
+    '''
+    function, jacobian, names = _model(model)
+    lower, upper = _bounds(x, names)
+    center, fwhm = names.index('center'), names.index('fwhm')
+    result = np.full((len(chunk), len(names) + 2), np.nan)
+    start = None
+    for i, y in enumerate(chunk):
+        valid = np.isfinite(y)
+        if valid.sum() <= len(names):
+            start = None
+            continue
+        xv, yv = x[valid], y[valid]
+        p0 = guess(xv, yv, model)
+        if start is not None and abs(p0[center] - start[center]) <= start[fwhm]:
+            p0 = start
+        p0 = np.clip(p0, lower, upper)
+        fit = least_squares(lambda p: function(xv, p) - yv, p0, jac=lambda p: jacobian(xv, p),
+                            bounds=(lower, upper), method='trf')
+        result[i, :len(names)] = fit.x
+        result[i, -2] = fit.cost
+        result[i, -1] = fit.success
+        start = fit.x if fit.success else None
+    return result
+
+
+def fit_peaks(fileset, model='lorentzian', window=None, variable=None, workers=None, chunksize=None):
+    '''
+    Fits one peak in every spectrum of a SpeFileSet.
+
+    Parameters
+    ----------
+    fileset : TYPE = SpeFileSet
+        DESCRIPTION. Spectra to fit (on the common grid if the calibrations differ, see SpeFileSet.resample).
+    model : TYPE = 'lorentzian', 'gaussian' or 'voigt' (pseudo-Voigt), optional
+        DESCRIPTION. The default is 'lorentzian'.
+    window : TYPE = Tuple (low, high), optional
+        DESCRIPTION. The default is None, i.e. the whole spectrum. Wavelength range holding the peak to fit.
+    variable : TYPE = String, optional
+        DESCRIPTION. The default is None, i.e. fileset.variable. Spectra are fitted in the order of this variable,
+        each one starting from the parameters of the previous sweep point.
+    workers : TYPE = Integer, optional
+        DESCRIPTION. The default is None, i.e. fileset.workers. Chunks of consecutive sweep points are fitted
+        in a process pool of this size.
+    chunksize : TYPE = Integer, optional
+        DESCRIPTION. The default is None, i.e. the spectra are split evenly between the workers.
+
+    Returns
+    -------
+    DataFrame with the index of fileset.df and the columns of the model parameters, cost and success
+
+    '''
+    if variable is None: variable = fileset.variable
+    if workers is None: workers = fileset.workers
+    names = _model(model)[2]
+    x, matrix = fileset._common()
+    x = np.asarray(x, dtype=float)
+    columns = np.ones(len(x), dtype=bool) if window is None else (x >= min(window)) & (x <= max(window))
+    x = x[columns]
+
+    order = np.argsort(fileset.df[variable].to_numpy(dtype=float), kind='stable')
+    rows = fileset.df['row'].to_numpy()[order]
+    if chunksize is None:
+        chunksize = max(1, -(-len(rows) // (workers or 1)))
+    chunks = [np.asarray(matrix[rows[start:start + chunksize]][:, columns], dtype=float)
+              for start in range(0, len(rows), chunksize)]
+    results = _map(partial(_fit_chunk, x=x, model=model), chunks, workers, processes=True)
+
+    values = np.full((len(rows), len(names) + 2), np.nan)
+    values[order] = np.concatenate(results) if results else values
+    table = pd.DataFrame(values, index=fileset.df.index, columns=names + ['cost', 'success'])
+    table['success'] = table['success'] == 1
+    return table
+
+
+def evaluate(x, table, model='lorentzian'):
+    '''
+    Returns the (n, len(x)) fitted curves of all rows of a fit_peaks table in one vectorized evaluation
+    '''
+    function, _, names = _model(model)
+    return function(np.asarray(x, dtype=float), table[names].to_numpy())
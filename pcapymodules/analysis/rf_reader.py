@@ -6,7 +6,8 @@ from dataclasses import dataclass
 from typing import List, Tuple, Optional
 import matplotlib.pyplot as plt
 
-from .loadfile import FileSet
+from .loadfile import FileSet, csv_schema, CSV_ENGINE
+from .manifest import get_manifest
 
 
 
@@ -77,13 +78,13 @@ class RFSA_file:
     
    
 
-def read_csv_flexible( path: str) -> Tuple[np.ndarray, np.ndarray]:
+def _power_columns(path: str) -> Tuple[str, str]:
     """
-    Reads a CSV and returns (freq_Hz, power_dBm).
+    Returns the (frequency, power) column names of a CSV.
     Accepts column names with minor variations.
     """
-    df = pd.read_csv(path)
-    cols = {c.lower().strip(): c for c in df.columns}
+    columns = pd.read_csv(path, nrows=0).columns
+    cols = {c.lower().strip(): c for c in columns}
     # Try common variants
     freq_col = None
     for k in ["freq(hz)", "frequency(hz)", "freq", "frequency"]:
@@ -97,7 +98,7 @@ def read_csv_flexible( path: str) -> Tuple[np.ndarray, np.ndarray]:
                 freq_col = v
                 break
     if freq_col is None:
-        raise ValueError(f"Could not find frequency column in {path}. Columns: {list(df.columns)}")
+        raise ValueError(f"Could not find frequency column in {path}. Columns: {list(columns)}")
 
     power_col = None
     for k in ["p(dbm)", "power(dbm)", "p", "power"]:
@@ -112,19 +113,35 @@ def read_csv_flexible( path: str) -> Tuple[np.ndarray, np.ndarray]:
                 break
     if power_col is None:
         # Last resort: take the second column
-        if len(df.columns) >= 2:
-            power_col = df.columns[1]
+        if len(columns) >= 2:
+            power_col = columns[1]
         else:
-            raise ValueError(f"Could not find power column in {path}. Columns: {list(df.columns)}")
+            raise ValueError(f"Could not find power column in {path}. Columns: {list(columns)}")
+    return freq_col, power_col
 
-    freq = pd.to_numeric(df[freq_col], errors="coerce").to_numpy()
-    pow_dbm = pd.to_numeric(df[power_col], errors="coerce").to_numpy()
+def read_csv_flexible( path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reads a CSV and returns (freq_Hz, power_dBm) as float64 arrays sorted by frequency.
+    The column names are detected once per folder and header line (see loadfile.csv_schema).
+    """
+    freq_col, power_col = csv_schema(path, _power_columns)
+    usecols = [freq_col] if freq_col == power_col else [freq_col, power_col]
+    try:
+        df = pd.read_csv(path, usecols=usecols, dtype=np.float64, engine=CSV_ENGINE)
+    except ValueError:
+        # Non numeric entries: coerce them to NaN
+        df = pd.read_csv(path, usecols=usecols).apply(pd.to_numeric, errors="coerce")
+    freq = df[freq_col].to_numpy(np.float64)
+    pow_dbm = df[power_col].to_numpy(np.float64)
 
     mask = np.isfinite(freq) & np.isfinite(pow_dbm)
-    freq, pow_dbm = freq[mask], pow_dbm[mask]
+    if not mask.all():
+        freq, pow_dbm = freq[mask], pow_dbm[mask]
 
     # Ensure sorted by frequency
-    order = np.argsort(freq)
+    if np.all(freq[1:] >= freq[:-1]):
+        return freq, pow_dbm
+    order = np.argsort(freq, kind="stable")
     return freq[order], pow_dbm[order]
 
 def _parse_fb_from_name(fname: str) -> Tuple[Optional[float], Optional[float]]:
@@ -135,24 +152,34 @@ def _parse_fb_from_name(fname: str) -> Tuple[Optional[float], Optional[float]]:
     B = float(m.group("B"))
     return f, B
 
-def load_traces(folder: str) -> List[Trace]:
-    traces: List[Trace] = []
+def _walk_csv(folder: str, manifest: bool = False) -> List[str]:
+    if manifest:
+        return get_manifest(folder, recursive=True).files(file_type=".csv")
+    paths = []
     for root, _, files in os.walk(folder):
         for fn in files:
             if fn.lower().endswith(".csv"):
-                path = os.path.join(root, fn)
-                f_GHz, B_T = _parse_fb_from_name(fn)
-                # If parsing fails, allow but set None; we will skip those without f
-                freq_Hz, pow_dbm = read_csv_flexible(path)
-                center = 0.5*(freq_Hz.min() + freq_Hz.max())
-                offset = freq_Hz - center
-                traces.append(Trace(
-                    f_GHz=f_GHz if f_GHz is not None else float("nan"),
-                    B_T=B_T if B_T is not None else float("nan"),
-                    offset_Hz=offset.astype(float),
-                    power_dBm=pow_dbm.astype(float),
-                    fname=path
-                ))
+                paths.append(os.path.join(root, fn))
+    return paths
+
+def load_traces(folder: str, manifest: bool = False) -> List[Trace]:
+    """
+    manifest: list the CSV files through the persistent folder manifest instead of walking the folder.
+    """
+    traces: List[Trace] = []
+    for path in _walk_csv(folder, manifest):
+        f_GHz, B_T = _parse_fb_from_name(os.path.basename(path))
+        # If parsing fails, allow but set None; we will skip those without f
+        freq_Hz, pow_dbm = read_csv_flexible(path)
+        center = 0.5*(freq_Hz.min() + freq_Hz.max())
+        offset = freq_Hz - center
+        traces.append(Trace(
+            f_GHz=f_GHz if f_GHz is not None else float("nan"),
+            B_T=B_T if B_T is not None else float("nan"),
+            offset_Hz=offset.astype(float),
+            power_dBm=pow_dbm.astype(float),
+            fname=path
+        ))
     if not traces:
         raise FileNotFoundError(f"No CSV files found under {folder}")
     # Filter out traces without a valid f_GHz (since Y axis is magnon frequency)
@@ -204,8 +231,8 @@ def interpolate_to_grid(traces: List[Trace], X: np.ndarray) -> Tuple[np.ndarray,
     meta = pd.DataFrame(meta_rows).sort_values("f_GHz").reset_index(drop=True)
     return X, Y, Z, meta
 
-def build_2d_map(folder: str, save_prefix: Optional[str] = None):
-    traces = load_traces(folder)
+def build_2d_map(folder: str, save_prefix: Optional[str] = None, manifest: bool = False):
+    traces = load_traces(folder, manifest)
     X = build_common_grid(traces)
     X, Y, Z, meta = interpolate_to_grid(traces, X)
     if save_prefix is None:
@@ -222,10 +249,18 @@ def my_rf_loader(filepath):
 
 
 class RFFileSet(FileSet):
-    def __init__(self, files, pattern = None, find_text = '', filename = None):
-        super().__init__(files, pattern, find_text, filename, file_type = '.csv', loader= my_rf_loader)
+    def __init__(self, files, pattern = None, find_text = '', filename = None, workers = None, processes = False,
+                 lazy = False, max_resident = 32, manifest = False, max_age = 0):
+        super().__init__(files, pattern, find_text, filename, file_type = '.csv', loader= my_rf_loader,
+                         workers = workers, processes = processes, lazy = lazy, max_resident = max_resident,
+                         manifest = manifest, max_age = max_age)
         self._load_data()
 
+    @classmethod
+    def open(cls, path, mmap = True, max_resident = 32):
+        # see FileSet.open
+        return super().open(path, mmap = mmap, loader = my_rf_loader, max_resident = max_resident)
+
     def _load_data(self, col=0, keys = ['x','y']):
         if col in self.df.columns:
             xlist = []; ylist = []
@@ -271,7 +306,9 @@ def read_s_from_file (filename, S=['S12'], separation =''):
         
     return (frequency, S_mag, S_phase)
     
-def get_files_by_first_number(folder_path, extension = 'csv'):
+def get_files_by_first_number(folder_path, extension = 'csv', manifest = False):
+    if manifest:
+        return get_manifest(folder_path).first_numbers(".%s"%extension)
     files_dict = {}
     for filename in os.listdir(folder_path):
         if filename.endswith(".%s"%extension):
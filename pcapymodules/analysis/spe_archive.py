@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Converts LightField .spe files into chunked, compressed HDF5 (.h5) or Zarr (.zarr) archives and reads them back
+with the same interface as spereader.SpeFile, so SpeFileSet can load either format.
+
+Archive layout:
+    roi0, roi1, ...  (nframes, ydim, xdim) pixel data, one chunk per frame
+    metadata         (nframes, nmeta) per-frame metadata, if present
+    wavelength       wavelength map, if present
+    footer           raw xml footer as bytes
+    attributes       source, header_version, nframes, dtype, metanames and the parsed footer fields (json)
+
+This requires the follwoing package to be installed:
+    h5py for .h5 archives (pip install h5py)
+    zarr for .zarr archives (pip install zarr)
+"""
+import os
+import json
+import numpy as np
+import untangle
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from . import spe_loader as sl
+from .spereader import SpeFile
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+try:
+    import zarr
+except ImportError:
+    zarr = None
+
+ARCHIVE_TYPES = {'.h5': 'h5', '.hdf5': 'h5', '.zarr': 'zarr'}
+
+
+def _require(fmt):
+    if fmt == 'h5' and h5py is None:
+        raise ImportError("h5py is required for .h5 archives. Install it with 'pip install h5py'")
+    if fmt == 'zarr' and zarr is None:
+        raise ImportError("zarr is required for .zarr archives. Install it with 'pip install zarr'")
+    if fmt not in ('h5', 'zarr'):
+        raise ValueError("fmt should be 'h5' or 'zarr', got %r" % fmt)
+
+
+def _create(group, fmt, name, shape, dtype, chunks, compression):
+    if fmt == 'h5':
+        return group.create_dataset(name, shape=shape, dtype=dtype, chunks=chunks, compression=compression)
+    if hasattr(group, 'create_array'):  # zarr >= 3
+        return group.create_array(name, shape=shape, dtype=dtype, chunks=chunks)
+    return group.create_dataset(name, shape=shape, dtype=dtype, chunks=chunks)
+
+
+def _read_footer_text(filepath):
+    with open(filepath, 'rb') as file:
+        footer_pos = sl.read_at(file, 678, 1, np.uint64)[0]
+        file.seek(footer_pos)
+        return file.read()
+
+
+def convert(filepath, out=None, fmt='h5', compression='gzip', chunk_frames=64):
+    '''
+    Converts a single .spe file into an archive.
+
+    Parameters
+    ----------
+    filepath : TYPE = String
+        DESCRIPTION. Path of the .spe file.
+    out : TYPE = String, optional
+        DESCRIPTION. The default is None. In that case the archive is written next to the .spe file.
+    fmt : TYPE = 'h5' or 'zarr', optional
+        DESCRIPTION. The default is 'h5'.
+    compression : TYPE = String, optional
+        DESCRIPTION. The default is 'gzip'. HDF5 compression filter ('gzip', 'lzf' or None).
+        Zarr archives use the zarr default compressor.
+    chunk_frames : TYPE = Integer, optional
+        DESCRIPTION. The default is 64. Number of frames copied at a time, which bounds memory use.
+
+    Returns
+    -------
+    Path of the archive
+
+    '''
+    _require(fmt)
+    if out is None:
+        out = os.path.splitext(filepath)[0] + ('.h5' if fmt == 'h5' else '.zarr')
+
+    spe = SpeFile(filepath, mmap=True)
+    fields = {key: value for key, value in spe.fields.items() if key != 'wavelength'}
+    attrs = {'source': os.path.abspath(filepath),
+             'header_version': float(spe.header_version),
+             'nframes': int(spe.nframes),
+             'dtype': np.dtype(spe.dtype).str,
+             'metanames': json.dumps(spe.metanames),
+             'fields': json.dumps(fields)}
+
+    store = h5py.File(out, 'w') if fmt == 'h5' else zarr.open_group(out, mode='w')
+    try:
+        for region, region_data in enumerate(spe.regions):
+            dset = _create(store, fmt, 'roi%d' % region, region_data.shape, region_data.dtype,
+                           (1,) + region_data.shape[1:], compression)
+            for start in range(0, spe.nframes, chunk_frames):
+                dset[start:start + chunk_frames] = region_data[start:start + chunk_frames]
+
+        if spe.metadata is not None:
+            _create(store, fmt, 'metadata', spe.metadata.shape, np.float64, spe.metadata.shape, compression)[:] = spe.metadata
+        if spe.wavelength is not None:
+            _create(store, fmt, 'wavelength', spe.wavelength.shape, np.float64, spe.wavelength.shape, compression)[:] = spe.wavelength
+
+        footer = np.frombuffer(_read_footer_text(filepath), np.uint8)
+        _create(store, fmt, 'footer', footer.shape, np.uint8, footer.shape, compression)[:] = footer
+
+        for key, value in attrs.items():
+            store.attrs[key] = value
+    finally:
+        if fmt == 'h5':
+            store.close()
+    return out
+
+
+def convert_files(filepaths, workers=None, **kwargs):
+    '''
+    Converts several .spe files in parallel with a process pool. kwargs are passed to convert (except out).
+    Returns the archive paths in the order of filepaths.
+    '''
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(partial(convert, **kwargs), filepaths))
+
+
+def convert_folder(folder, find_text='', workers=None, **kwargs):
+    '''
+    Converts all .spe files of a folder whose name contains find_text. See convert_files.
+    '''
+    filepaths = [os.path.join(folder, f) for f in sorted(os.listdir(folder))
+                 if f.lower().endswith('.spe') and find_text in f]
+    return convert_files(filepaths, workers=workers, **kwargs)
+
+
+class _FrameList:
+    '''
+    Sequence giving data[frame][roi] access on top of per-region arrays without reading all frames
+    '''
+    def __init__(self, regions):
+        self.regions = regions
+
+    def __len__(self):
+        return len(self.regions[0]) if self.regions else 0
+
+    def __getitem__(self, frame):
+        return [region_data[frame] for region_data in self.regions]
+
+
+class SpeArchive(SpeFile):
+    '''
+    This is a class that holds an .h5 or .zarr archive written by convert, with the interface of spereader.SpeFile
+    '''
+    def __init__(self, filepath, lazy=True):
+        '''
+        lazy: if True, regions stay on disk and each frame is read when it is indexed.
+        Otherwise all frames are read into memory on open and the archive is closed again.
+        '''
+        self.filepath = filepath
+        self.mmap = lazy
+        self._footer = None
+        self._fmt = ARCHIVE_TYPES.get(os.path.splitext(filepath)[1].lower())
+        _require(self._fmt)
+
+        store = self._open()
+        attrs = store.attrs
+
+        self.source = attrs['source']
+        self.header_version = attrs['header_version']
+        self.nframes = int(attrs['nframes'])
+        self.dtype = np.dtype(attrs['dtype']).type
+        self.fields = json.loads(attrs['fields'])
+        self.fields['dims'] = [tuple(dims) for dims in self.fields['dims']]
+        self.fields.setdefault('exposure', None)
+        self.fields['wavelength'] = store['wavelength'][:] if 'wavelength' in store else None
+
+        self.xdim, self.ydim = self._get_dims()
+        self.roi, self.nroi = self._get_roi_info()
+        self.wavelength = self._get_wavelength()
+        self.xcoord, self.ycoord = self._get_coords()
+        self.frame_indices = np.arange(self.nframes)
+
+        self.metanames = json.loads(attrs['metanames'])
+        self.metadata = store['metadata'][:] if 'metadata' in store else None
+        self._store = store
+        self._set_regions()
+        if not lazy:
+            self.close()
+
+    def _open(self):
+        return h5py.File(self.filepath, 'r') if self._fmt == 'h5' else zarr.open_group(self.filepath, mode='r')
+
+    def _set_regions(self):
+        self.regions = [self._store['roi%d' % region] for region in range(self.nroi)]
+        if not self.mmap:
+            self.regions = [region_data[:] for region_data in self.regions]
+        self.data = _FrameList(self.regions)
+
+    def close(self):
+        '''
+        Closes the archive. Lazy regions can not be read any more after this.
+        '''
+        if self._store is not None and self._fmt == 'h5':
+            self._store.close()
+        self._store = None
+
+    def __getstate__(self):
+        # the h5py handle can not be pickled (e.g. for a process pool): lazy regions are reopened on unpickling
+        state = self.__dict__.copy()
+        state['_store'] = None
+        if self.mmap:
+            state['regions'] = state['data'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.mmap:
+            self._store = self._open()
+            self._set_regions()
+
+    @property
+    def footer(self):
+        if self._footer is None:
+            if self._store is None:
+                store = self._open()
+                try:
+                    text = bytes(store['footer'][:])
+                finally:
+                    if self._fmt == 'h5':
+                        store.close()
+            else:
+                text = bytes(self._store['footer'][:])
+            self._footer = untangle.parse(text.decode())
+        return self._footer
@@ -2,19 +2,57 @@
 """
 This module imports a Princeton Instruments LightField (SPE 3.0) file into a python environment.
 """
+import os
+import time
+import hashlib
+import pickle
 import numpy as np
 import untangle
+import xml.etree.ElementTree as ET
 from io import StringIO
 
+from .despike import despike_frames, despike_neighbors
+
+# On-disk cache of parsed footer fields. Set CACHE_DIR = None to disable it.
+CACHE_DIR = os.path.join(os.path.expanduser('~'), 'Documents', 'pca_py_files', 'spe_cache')
+CACHE_MAX_BYTES = 256 * 1024 ** 2
+
+# Element paths (namespace stripped) of the footer entries read by SpeFile._read_footer_fields
+_FRAME_BLOCK_PATH = ('SpeFormat', 'DataFormat', 'DataBlock')
+_REGION_BLOCK_PATH = _FRAME_BLOCK_PATH + ('DataBlock',)
+_META_BLOCK_PATH = ('SpeFormat', 'MetaFormat', 'MetaBlock')
+_WAVELENGTH_PATH = ('SpeFormat', 'Calibrations', 'WavelengthMapping', 'Wavelength')
+_DEVICES_PATH = ('SpeFormat', 'DataHistories', 'DataHistory', 'Origin', 'Experiment', 'Devices')
+_ROI_PATH = _DEVICES_PATH + ('Cameras', 'Camera', 'ReadoutControl', 'RegionsOfInterest')
+_CENTER_WAVELENGTH_PATH = _DEVICES_PATH + ('Spectrometers', 'Spectrometer', 'Grating', 'CenterWavelength')
+_EXPOSURE_PATH = _DEVICES_PATH + ('Cameras', 'Camera', 'ShutterTiming', 'ExposureTime')
+
 
 class SpeFile:
-    def __init__(self, filepath):
+    def __init__(self, filepath, mmap=False, header_only=False, cache=True, frames=None, rois=None, rows=None):
+        """
+        mmap: if True, data[frame][roi] are read-only views into an np.memmap of the file instead of
+        arrays read into memory. Pixels are only paged in from disk when a view is accessed.
+        header_only: if True, only the binary header and the footer fields are read; data, regions
+        and metadata are left as None. Useful to catalog many files quickly.
+        cache: if True, the parsed footer fields are read from / written to the on-disk cache in CACHE_DIR,
+        so re-opening an unchanged file skips the XML parse.
+        frames, rois, rows: optional selection (int, slice or list of indices; rows also accepts a (start, stop)
+        tuple) of the frames, regions of interest and rows within each region to load. Only the requested
+        bytes are read from disk. nframes, roi, nroi, xdim, ydim, xcoord and ycoord then describe the selection
+        and self.frame_indices maps the loaded frames back to their index in the file.
+
+        Besides data, self.regions holds one (nframes, ydim, xdim) array per region of interest and
+        self.metadata is an (nframes, len(self.metanames)) matrix.
+        """
         if filepath is None:
             print("Deprecation Warning: construct via gui has been deprecated in this module. "
                   "Use load() in spe2py instead.")
             return
         assert isinstance(filepath, str), 'Filepath must be a single string'
         self.filepath = filepath
+        self.mmap = mmap
+        self._footer = None
 
         with open(self.filepath) as file:
             self.header_version = read_at(file, 1992, 3, np.float32)[0]
@@ -23,19 +61,93 @@ class SpeFile:
 
             self.nframes = read_at(file, 1446, 2, np.uint16)[0]
 
-            self.footer = self._read_footer(file)
+            self.fields = load_cached_fields(self.filepath) if cache else None
+            if self.fields is None:
+                self.fields = self._read_footer_fields(file)
+                if cache:
+                    save_cached_fields(self.filepath, self.fields)
             self.dtype = self._get_dtype(file)
 
-            # Note: these methods depend on self.footer
+            # Note: these methods depend on self.fields
             self.xdim, self.ydim = self._get_dims()
             self.roi, self.nroi = self._get_roi_info()
             self.wavelength = self._get_wavelength()
 
             self.xcoord, self.ycoord = self._get_coords()
 
-            self.data, self.metadata, self.metanames = self._read_data(file)
+            self.frame_indices = np.arange(self.nframes)
+
+            if header_only:
+                self.data, self.metadata, self.metanames = None, None, None
+                self.regions = None
+            elif self.mmap or frames is not None or rois is not None or rows is not None:
+                self.data, self.metadata, self.metanames = self._map_data(frames, rois, rows, copy=not self.mmap)
+            else:
+                self.data, self.metadata, self.metanames = self._read_data(file)
         file.close()
 
+    @property
+    def footer(self):
+        """
+        The complete XML footer as an 'untangle' object. It is parsed from the file on first access only.
+        """
+        if self._footer is None:
+            with open(self.filepath) as file:
+                self._footer = self._read_footer(file)
+        return self._footer
+
+    @staticmethod
+    def _read_footer_fields(file):
+        """
+        Streams the xml footer and keeps only the entries needed to decode the file:
+        frame stride/size, region dims, metadata layout, regions of interest, wavelength map,
+        grating center wavelength and exposure time. Returns them as a dict of plain python/numpy values.
+        """
+        footer_pos = read_at(file, 678, 8, np.uint64)[0]
+
+        fields = {'stride': None, 'size': None, 'dims': [], 'meta': [], 'regions': {},
+                  'wavelength': None, 'center_wavelength': None, 'exposure': None}
+
+        parser = ET.XMLPullParser(events=('start', 'end'))
+        path = []
+        file.seek(footer_pos)
+        for chunk in iter(lambda: file.read(65536), ''):
+            parser.feed(chunk)
+            for event, element in parser.read_events():
+                if event == 'start':
+                    path.append(element.tag.rsplit('}', 1)[-1])
+                    current = tuple(path)
+                    if current == _FRAME_BLOCK_PATH:
+                        fields['stride'] = int(element.get('stride'))
+                        fields['size'] = int(element.get('size'))
+                    elif current == _REGION_BLOCK_PATH:
+                        fields['dims'].append((int(element.get('width')), int(element.get('height'))))
+                    elif current[:-1] == _META_BLOCK_PATH:
+                        if current[-1] == 'TimeStamp':  # Specify ExposureStarted vs. ExposureEnded
+                            name = element.get('event')
+                        elif current[-1] == 'GateTracking':  # Specify Delay vs. Width
+                            name = element.get('component')
+                        else:
+                            name = current[-1]
+                        fields['meta'].append((name, element.get('type')))
+                    elif current[:-1] == _ROI_PATH:
+                        fields['regions'][current[-1]] = []
+                    elif current[:-2] == _ROI_PATH:
+                        fields['regions'][current[-2]].append(dict(element.attrib))
+                else:
+                    current = tuple(path)
+                    if current == _WAVELENGTH_PATH and element.text:
+                        fields['wavelength'] = np.loadtxt(StringIO(element.text), delimiter=',')
+                    elif current == _CENTER_WAVELENGTH_PATH and fields['center_wavelength'] is None:
+                        fields['center_wavelength'] = float(element.text)
+                    elif current == _EXPOSURE_PATH and fields['exposure'] is None and element.text:
+                        fields['exposure'] = float(element.text)
+                    path.pop()
+                    element.clear()
+        parser.close()
+
+        return fields
+
     @staticmethod
     def _read_footer(file):
         """
@@ -80,24 +192,11 @@ class SpeFile:
         return dtype
 
     def _get_meta_dtype(self):
-        meta_types = []
-        meta_names = []
-        prev_item = None
-        for item in dir(self.footer.SpeFormat.MetaFormat.MetaBlock):
-            if item == 'TimeStamp' and prev_item != 'TimeStamp':  # Specify ExposureStarted vs. ExposureEnded
-                for element in self.footer.SpeFormat.MetaFormat.MetaBlock.TimeStamp:
-                    meta_names.append(element['event'])
-                    meta_types.append(element['type'])
-                prev_item = 'TimeStamp'
-            elif item == 'GateTracking' and prev_item != 'GateTracking':  # Specify Delay vs. Width
-                for element in self.footer.SpeFormat.MetaFormat.MetaBlock.GateTracking:
-                    meta_names.append(element['component'])
-                    meta_types.append(element['type'])
-                prev_item = 'GateTracking'
-            elif prev_item != item:  # All other metablock names only have one possible value
-                meta_names.append(item)
-                meta_types.append(getattr(self.footer.SpeFormat.MetaFormat.MetaBlock, item)['type'])
-                prev_item = item
+        """
+        Returns the numpy types and names of the per-frame metadata blocks, in the order they are stored on disk.
+        """
+        meta_names = [name for name, _ in self.fields['meta']]
+        meta_types = [type_str for _, type_str in self.fields['meta']]
 
         for index, type_str in enumerate(meta_types):
             if type_str == 'Int64':
@@ -107,50 +206,63 @@ class SpeFile:
 
         return meta_types, meta_names
 
+    def _get_frame_dtype(self):
+        """
+        Returns a numpy structured dtype describing one frame as stored on disk: one field per region of interest
+        ('roi0', 'roi1', ...) followed by the metadata fields. Its itemsize is the frame stride in the XML footer.
+        """
+        frame_stride = self.fields['stride']
+        frame_size = self.fields['size']
+
+        names, formats, offsets = [], [], []
+        offset = 0
+        for region in range(0, self.nroi):
+            shape = self._get_region_shape(region)
+            names.append('roi%d' % region)
+            formats.append((self.dtype, shape))
+            offsets.append(offset)
+            offset += int(np.prod(shape)) * np.dtype(self.dtype).itemsize
+
+        if frame_stride - frame_size != 0:
+            metadata_dtypes, metadata_names = self._get_meta_dtype()
+            offset = frame_size
+            for name, meta_dtype in zip(metadata_names, metadata_dtypes):
+                names.append(name)
+                formats.append(meta_dtype)
+                offsets.append(offset)
+                offset += np.dtype(meta_dtype).itemsize
+        else:
+            metadata_names = None
+
+        frame_dtype = np.dtype({'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': frame_stride})
+        return frame_dtype, metadata_names
+
     def _get_roi_info(self):
         """
         Returns region of interest attributes and numbers of regions of interest
         """
         try:
-            camerasettings = self.footer.SpeFormat.DataHistories.DataHistory.Origin.Experiment.Devices.Cameras.Camera
-            regionofinterest = camerasettings.ReadoutControl.RegionsOfInterest.CustomRegions.RegionOfInterest
-        except AttributeError:
-            print("XML Footer was not loaded prior to calling _get_roi_info")
+            roi = self.fields['regions']['CustomRegions']
+        except KeyError:
+            print("XML Footer does not contain custom regions of interest")
             raise
 
-        if isinstance(regionofinterest, list):
-            nroi = len(regionofinterest)
-            roi = regionofinterest
-        else:
-            nroi = 1
-            roi = [regionofinterest]  # cast element to list for consistency
-
-        return roi, nroi
+        return roi, len(roi)
 
     def _get_wavelength(self):
         """
         Returns wavelength-to-pixel map as stored in XML footer
         """
-        try:
-            wavelength_string = StringIO(self.footer.SpeFormat.Calibrations.WavelengthMapping.Wavelength.cdata)
-        except AttributeError:
-            print("XML Footer was not loaded prior to calling _get_wavelength or \n"
-                  "XML Footer does not contain Wavelength Mapping information")
-            return
-        except IndexError:
+        if self.fields['wavelength'] is None:
             print("XML Footer does not contain Wavelength Mapping information")
-            return
-
-        wavelength = np.loadtxt(wavelength_string, delimiter=',')
-
-        return wavelength
+        return self.fields['wavelength']
 
     def _get_dims(self):
         """
         Returns the x and y dimensions for each region as stored in the XML footer
         """
-        xdim = [int(block["width"]) for block in self.footer.SpeFormat.DataFormat.DataBlock.DataBlock]
-        ydim = [int(block["height"]) for block in self.footer.SpeFormat.DataFormat.DataBlock.DataBlock]
+        xdim = [width for width, _ in self.fields['dims']]
+        ydim = [height for _, height in self.fields['dims']]
 
         return xdim, ydim
 
@@ -178,40 +290,135 @@ class SpeFile:
 
         return xcoord, ycoord
 
+    def _get_region_shape(self, region):
+        """
+        Returns the (ydim, xdim) of the pixel block stored for a region in each frame
+        """
+        if self.nroi > 1:
+            return len(self.ycoord[region]), len(self.xcoord[region])
+        return int(self.ydim[region]), int(self.xdim[region])
+
+    def _map_data(self, frames=None, rois=None, rows=None, copy=False):
+        """
+        Maps all frames as a structured np.memmap. Region and metadata fields are strided views into the file,
+        so nothing is read on open. An optional frames/rois/rows selection is applied to the views, and with
+        copy=True only the selected bytes are then read into memory.
+        """
+        frame_dtype, metadata_names = self._get_frame_dtype()
+        mapped = np.memmap(self.filepath, dtype=frame_dtype, mode='r', offset=4100, shape=(self.nframes,))
+
+        frames = _as_index(frames)
+        rois = range(self.nroi) if rois is None else np.atleast_1d(rois).tolist()
+        rows = _as_index(rows)
+
+        result = self._unpack_frames(mapped, metadata_names, copy, frames, rois, rows)
+        self._select(frames, rois, rows)
+        return result
+
     def _read_data(self, file):
         """
-        Loads raw image data into an nframes X nroi list of arrays.
+        Loads all frames with a single read using the structured frame dtype.
         """
+        frame_dtype, metadata_names = self._get_frame_dtype()
         file.seek(4100)
+        frames = np.fromfile(file, frame_dtype, self.nframes)
+        return self._unpack_frames(frames, metadata_names, copy=True)
 
-        frame_stride = int(self.footer.SpeFormat.DataFormat.DataBlock['stride'])
-        frame_size = int(self.footer.SpeFormat.DataFormat.DataBlock['size'])
-        metadata_size = frame_stride - frame_size
-        if metadata_size != 0:
-            metadata_dtypes, metadata_names = self._get_meta_dtype()
-            metadata = np.zeros((self.nframes, len(metadata_dtypes)))
+    def _unpack_frames(self, frames, metadata_names, copy, frame_index=slice(None), rois=None, rows=slice(None)):
+        """
+        Splits a structured frame array into one (nframes, ydim, xdim) array per region (self.regions),
+        the nframes X nroi list of views kept as self.data, and an (nframes, nmeta) metadata matrix.
+        With copy=True each region is made contiguous; otherwise the regions stay views into frames.
+        frame_index, rois and rows restrict the output to the selected frames, regions and rows.
+        """
+        if rois is None:
+            rois = range(self.nroi)
+
+        regions = []
+        for region in rois:
+            region_data = frames['roi%d' % region][frame_index][:, rows]
+            if copy:
+                region_data = np.ascontiguousarray(region_data)
+            regions.append(region_data)
+        self.regions = regions
+
+        nframes = len(regions[0]) if regions else 0
+        data = [[region_data[frame] for region_data in regions] for frame in range(nframes)]
+
+        if metadata_names is not None:
+            metadata = np.column_stack([frames[name][frame_index].astype(np.float64) for name in metadata_names])
         else:
-            metadata_dtypes, metadata_names = None, None
             metadata = None
 
-        data = [[0 for _ in range(self.nroi)] for _ in range(self.nframes)]
-        for frame in range(0, self.nframes):
-            for region in range(0, self.nroi):
-                if self.nroi > 1:
-                    data_xdim = len(self.xcoord[region])
-                    data_ydim = len(self.ycoord[region])
-                else:
-                    data_xdim = np.asarray(self.xdim[region], np.uint32)
-                    data_ydim = np.asarray(self.ydim[region], np.uint32)
-                data[frame][region] = np.fromfile(file, self.dtype, data_xdim * data_ydim).reshape(data_ydim, data_xdim)
-            if metadata_dtypes is not None:
-                for meta_block in range(len(metadata_dtypes)):
-                    metadata[frame, meta_block] = np.fromfile(file, dtype=metadata_dtypes[meta_block], count=1)
-
         return data, metadata, metadata_names
 
 
-def load_from_files(filepaths):
+    def _select(self, frames, rois, rows):
+        """
+        Restricts the frame and region attributes to a selection made in _map_data
+        """
+        self.frame_indices = self.frame_indices[frames]
+        self.nframes = len(self.frame_indices)
+
+        self.roi = [self.roi[region] for region in rois]
+        self.nroi = len(self.roi)
+        self.xdim = [self.xdim[region] for region in rois]
+        self.ydim = [np.arange(self.ydim[region])[rows].size for region in rois]
+        self.xcoord = [self.xcoord[region] for region in rois]
+        if isinstance(rows, slice):
+            self.ycoord = [self.ycoord[region][rows] for region in rois]
+        else:
+            self.ycoord = [[self.ycoord[region][row] for row in rows] for region in rois]
+
+
+    def despike(self, threshold=6, method=None, width=2):
+        """
+        Removes cosmic-ray spikes from all regions (see the despike module). method is 'frames' (median over
+        the frames of the series) or 'neighbors' (steps along x); by default 'frames' if there are at least
+        3 frames. Regions that are read-only views into the file, or datasets of a lazy spe_archive.SpeArchive,
+        are replaced by cleaned copies in memory.
+        The masks of replaced pixels are kept in self.spike_masks, one (nframes, ydim, xdim) array per region.
+        """
+        if method is None:
+            method = 'frames' if self.nframes >= 3 else 'neighbors'
+        if method not in ('frames', 'neighbors'):
+            raise ValueError("method should be 'frames' or 'neighbors', got %r" % method)
+        regions, masks = [], []
+        for region_data in self.regions:
+            if not isinstance(region_data, np.ndarray):
+                region_data = np.asarray(region_data[:])
+            out = region_data if region_data.flags.writeable else None
+            if method == 'frames':
+                cleaned, mask = despike_frames(region_data, threshold, out)
+            else:
+                cleaned, mask = despike_neighbors(region_data, threshold, width, out)
+            regions.append(cleaned)
+            masks.append(mask)
+        if any(cleaned is not region_data for cleaned, region_data in zip(regions, self.regions)):
+            self.data = [[region_data[frame] for region_data in regions] for frame in range(self.nframes)]
+        self.regions = regions
+        self.spike_masks = masks
+        return self
+
+
+def _as_index(selection):
+    """
+    Converts a frame or row selection (None, int, (start, stop) tuple, slice or list) to an index that keeps
+    the selected axis when applied to an array.
+    """
+    if selection is None:
+        return slice(None)
+    if isinstance(selection, (int, np.integer)):
+        # -1 is the last one: slice(-1, 0) would be empty
+        return slice(selection, selection + 1 or None)
+    if isinstance(selection, tuple):
+        return slice(*selection)
+    if isinstance(selection, slice):
+        return selection
+    return np.asarray(selection)
+
+
+def load_from_files(filepaths, mmap=False):
     """
     Allows user to load multiple files at once. Each file is stored as an SpeFile object in the list batch.
     """
@@ -220,7 +427,7 @@ def load_from_files(filepaths):
         return
     batch = [[] for _ in range(0, len(filepaths))]
     for file in range(0, len(filepaths)):
-        batch[file] = SpeFile(filepaths[file])
+        batch[file] = SpeFile(filepaths[file], mmap=mmap)
     return_type = "list of SpeFile objects"
     if len(batch) == 1:
         batch = batch[0]
@@ -229,6 +436,158 @@ def load_from_files(filepaths):
     return batch
 
 
+def follow(filepath, like=None, poll_interval=0.2, timeout=30.0, despike=None):
+    """
+    Generator over the frames of an SPE file that is still being written, e.g. by LightField during
+    LFApplication.acquire. The file size is polled and (index, frame) is yielded for every newly completed
+    frame, where frame is the list of region arrays that data[index] holds (read-only views into the file).
+
+    Until the footer is written the frame layout is taken from `like`, an SpeFile recorded with the same
+    settings, or otherwise from the binary header (single region, no metadata). Once the footer appears
+    it is parsed and the layout and frame count from it are used.
+
+    Stops when the footer is present and all frames have been yielded, or when the file has not grown
+    for `timeout` seconds (None waits forever).
+
+    With despike set to a threshold, every frame is cleaned of cosmic-ray spikes by despike_neighbors
+    before it is yielded (the regions are then copies).
+    """
+    frame_dtype = None
+    nroi = 1
+    if like is not None:
+        frame_dtype = like._get_frame_dtype()[0]
+        nroi = like.nroi
+
+    index = 0
+    nframes = None
+    footer_pos = 0
+    last_size = -1
+    last_change = time.time()
+    while True:
+        size = os.path.getsize(filepath)
+        if size >= 4100:
+            if nframes is None:
+                with open(filepath, 'rb') as file:
+                    footer_pos = int(read_at(file, 678, 1, np.uint64)[0])
+                    if frame_dtype is None:
+                        frame_dtype = _header_frame_dtype(file)
+                if 0 < footer_pos < size:
+                    try:
+                        spe = SpeFile(filepath, header_only=True, cache=False)
+                    except ET.ParseError:
+                        # footer only partly written yet, poll again
+                        spe = None
+                    if spe is not None:
+                        frame_dtype = spe._get_frame_dtype()[0]
+                        nroi = spe.nroi
+                        nframes = spe.nframes
+
+            available = (size - 4100) // frame_dtype.itemsize
+            if nframes is not None:
+                available = min(available, nframes)
+            elif 0 < footer_pos:
+                # the bytes from footer_pos on are footer, not frames
+                available = min(available, (footer_pos - 4100) // frame_dtype.itemsize)
+            if available > index:
+                mapped = np.memmap(filepath, dtype=frame_dtype, mode='r', offset=4100, shape=(available,))
+                for frame in range(index, available):
+                    regions = [mapped['roi%d' % region][frame] for region in range(nroi)]
+                    if despike is not None:
+                        regions = [despike_neighbors(region_data, despike)[0] for region_data in regions]
+                    yield frame, regions
+                index = available
+
+        if nframes is not None and index >= nframes:
+            return
+        if size != last_size:
+            last_size = size
+            last_change = time.time()
+        elif timeout is not None and time.time() - last_change > timeout:
+            return
+        time.sleep(poll_interval)
+
+
+def _header_frame_dtype(file):
+    """
+    Returns the frame dtype described by the legacy xdim/ydim/datatype entries of the binary header,
+    assuming a single region and no per-frame metadata.
+    """
+    xdim = int(read_at(file, 42, 1, np.uint16)[0])
+    ydim = int(read_at(file, 656, 1, np.uint16)[0])
+    return np.dtype([('roi0', SpeFile._get_dtype(file), (ydim, xdim))])
+
+
+def _cache_path(filepath):
+    """
+    Returns the cache entry path for a file. The key covers the absolute path, size and modification time,
+    so a rewritten file never hits a stale entry.
+    """
+    stat = os.stat(filepath)
+    identity = '%s|%d|%d' % (os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns)
+    return os.path.join(CACHE_DIR, hashlib.sha1(identity.encode()).hexdigest() + '.pkl')
+
+
+def load_cached_fields(filepath):
+    """
+    Returns the cached footer fields of filepath, or None if caching is disabled or there is no valid entry.
+    """
+    if CACHE_DIR is None:
+        return None
+    try:
+        entry = _cache_path(filepath)
+        with open(entry, 'rb') as fp:
+            fields = pickle.load(fp)
+        os.utime(entry)  # mark as recently used for eviction
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    if 'exposure' not in fields:  # entry written before the exposure time was read
+        return None
+    return fields
+
+
+def save_cached_fields(filepath, fields):
+    """
+    Stores the footer fields of filepath in the cache and evicts the least recently used entries
+    once the cache grows beyond CACHE_MAX_BYTES. Failures to write are ignored.
+    """
+    if CACHE_DIR is None:
+        return
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        entry = _cache_path(filepath)
+        with open(entry + '.tmp', 'wb') as fp:
+            pickle.dump(fields, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(entry + '.tmp', entry)
+        _evict_cache()
+    except OSError:
+        pass
+
+
+def _evict_cache():
+    entries = []
+    for item in os.scandir(CACHE_DIR):
+        if item.name.endswith('.pkl'):
+            stat = item.stat()
+            entries.append((stat.st_mtime, stat.st_size, item.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= CACHE_MAX_BYTES:
+            break
+        os.remove(path)
+        total -= size
+
+
+def clear_cache():
+    """
+    Removes all entries from the footer cache.
+    """
+    if CACHE_DIR is None or not os.path.isdir(CACHE_DIR):
+        return
+    for item in os.scandir(CACHE_DIR):
+        if item.name.endswith('.pkl'):
+            os.remove(item.path)
+
+
 def read_at(file, pos, size, ntype):
     """
     Reads SPE source file at specific byte position.
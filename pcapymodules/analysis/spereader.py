@@ -30,30 +30,31 @@ class SpeFile (sl.SpeFile):
         Returns region of interest attributes and numbers of regions of interest
         """
         try:
-            camerasettings = self.footer.SpeFormat.DataHistories.DataHistory.Origin.Experiment.Devices.Cameras.Camera
             #regionofinterest = camerasettings.ReadoutControl.RegionsOfInterest.CustomRegions.RegionOfInterest
             #In original class this was always referring to custom regions 
             #which gives error if custom region is different than used region
-            regionofinterest = camerasettings.ReadoutControl.RegionsOfInterest.children[-1].children
+            roi = list(self.fields['regions'].values())[-1]
             
-        except AttributeError:
-            print("XML Footer was not loaded prior to calling _get_roi_info")
+        except IndexError:
+            print("XML Footer does not contain regions of interest")
             raise
 
-        if isinstance(regionofinterest, list):
-            nroi = len(regionofinterest)
-            roi = regionofinterest
-        else:
-            nroi = 1
-            roi = [regionofinterest]  # cast element to list for consistency
-
-        return roi, nroi
+        return roi, len(roi)
     
     
     @property
     def central_wavelength(self):
-        s=self.footer.SpeFormat.DataHistories.DataHistory.Origin.Experiment.Devices.Spectrometers.Spectrometer.Grating.CenterWavelength.cdata
-        return float(s)
+        s=self.fields['center_wavelength']
+        if s is None:
+            raise AttributeError('XML Footer does not contain the grating center wavelength')
+        return s
+    
+    @property
+    def exposure_time(self):
+        s=self.fields['exposure']
+        if s is None:
+            raise AttributeError('XML Footer does not contain the exposure time')
+        return s
     
     @property
     def image_mode(self):
@@ -79,19 +80,75 @@ class SpeFile (sl.SpeFile):
         (x,y) array -> x is wavelength, y is intensity
 
         '''
-        x = self.xcoord[0]
-        
-        if self.central_wavelength > 0 and  self.wavelength is not None:
-            x=self.wavelength
         y = self.data[frame][roi]
         if row == None:
             row = int(y.shape[0]/2)
             
-        #print (len(x), len(y[row]))
-        if len(x) == len(y[row]):   
-            return (x,y[row].astype(np.int32))
+        return (self._get_x(len(y[row])),y[row].astype(np.int32))
+    
+    def get_spectra (self, roi = 0, row=None, rows=None, binning='sum', fvb=False, frames=None, dtype=None):
+        '''
+        This generates the spectra of all frames from a SpeFile in one operation
+
+        Parameters
+        ----------
+        roi : TYPE = Integer, optional
+            DESCRIPTION. The default is 0.
+        row : TYPE = Integer, optional
+            DESCRIPTION. The default is None. In that case the middle row will be chosen if there are multiple.
+        rows : TYPE = (start, stop) tuple, optional
+            DESCRIPTION. The default is None. Range of rows binned into one spectrum, overrides row.
+        binning : TYPE = 'sum' or 'mean', optional
+            DESCRIPTION. The default is 'sum'. How rows are combined for rows and fvb.
+        fvb : TYPE = Boolean, optional
+            DESCRIPTION. The default is False. Full vertical binning: combine all rows of the region.
+        frames : TYPE = Integer, slice or list, optional
+            DESCRIPTION. The default is None, meaning all frames.
+        dtype : TYPE = numpy dtype, optional
+            DESCRIPTION. The default is None, keeping the stored dtype for a single row (returned as a view).
+            For example np.float32.
+        
+        Returns
+        -------
+        (x,Y) array -> x is wavelength, Y is an (nframes, npixels) intensity matrix
+
+        '''
+        z = self.regions[roi]
+        if frames is not None:
+            z = z[sl._as_index(frames)]
+        
+        if fvb:
+            rows = (0, z.shape[1])
+        if rows is not None:
+            z = z[:, rows[0]:rows[1], :]
+            if binning == 'sum':
+                y = z.sum(axis=1, dtype=dtype)
+            elif binning == 'mean':
+                y = z.mean(axis=1, dtype=dtype)
+            else:
+                raise ValueError("binning should be 'sum' or 'mean', got %r" % binning)
+        else:
+            if row == None:
+                row = int(z.shape[1]/2)
+            y = z[:, row, :]
+        
+        if dtype is not None:
+            y = y.astype(dtype, copy=False)
+        return (self._get_x(y.shape[1]), y)
+    
+    def _get_x (self, npixels):
+        '''
+        Returns the x axis of a spectrum with npixels points: the wavelength map if available, else the pixel coordinates
+        '''
+        x = self.xcoord[0]
+        
+        if self.central_wavelength > 0 and  self.wavelength is not None:
+            x=self.wavelength
+        
+        if len(x) == npixels:   
+            return x
         else:   
-            return (x[self.xcoord[0]],y[row].astype(np.int32))
+            return x[self.xcoord[0]]
     
     def plot_spectrum (self, frame=0, roi = 0, row=None, **kwargs):
         '''